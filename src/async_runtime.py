@@ -0,0 +1,183 @@
+import time
+import socket
+import asyncio
+
+import config
+import metrics
+from datalog import datalogger
+from events import event_hub
+from gc_manager import gc_manager
+from history import sensor_history
+from http_server import HTTPError, RequestReader, send_response
+from scheduler import scheduler
+
+class StreamConn:
+    """Socket-like adapter so handle_request can write to a stream"""
+    def __init__(self, writer):
+        self.writer = writer
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.writer.write(data)
+        return len(data)
+
+    def backlog(self):
+        """Bytes written but not yet accepted by the socket"""
+        out_buf = getattr(self.writer, 'out_buf', None)
+        if out_buf is not None:
+            return len(out_buf)
+        return self.writer.transport.get_write_buffer_size()
+
+    def close(self):
+        self.writer.close()
+
+async def _every(interval_ms, func):
+    while True:
+        started = time.ticks_us()
+        try:
+            func()
+        except Exception as e:
+            print(f'Task error: {e}')
+        elapsed_us = time.ticks_diff(time.ticks_us(), started)
+        metrics.loop_time.observe(elapsed_us)
+        elapsed = elapsed_us // 1000
+        if elapsed > interval_ms:
+            metrics.loop_overruns.inc()
+        await asyncio.sleep(max(0, interval_ms - elapsed) / 1000)
+
+def _update_sensors(device_manager):
+    def update():
+        device_manager.update_sensors()
+        device_manager.sample_sensors()
+    return update
+
+# Request buffers shared by the connections being served
+readers = []
+
+async def _read_request(reader, request_reader):
+    request_reader.reset()
+    timeout = config.HTTP_TIMEOUT / 1000
+    # MicroPython streams read straight into the request buffer,
+    # CPython's StreamReader only hands out new bytes objects
+    readinto = getattr(reader, 'readinto', None)
+    
+    while True:
+        free = request_reader.free()
+        if readinto is not None:
+            count = await asyncio.wait_for(readinto(free), timeout)
+        else:
+            data = await asyncio.wait_for(reader.read(len(free)), timeout)
+            count = len(data)
+            free[:count] = data
+        request = request_reader.feed(count)
+        if request is not None:
+            return request
+
+async def _serve_client(reader, writer, handle_request):
+    conn = StreamConn(writer)
+    request_reader = readers.pop() if readers else None
+    keep_open = False
+    try:
+        if request_reader is None:
+            raise HTTPError(503, "Too many connections")
+        request = await _read_request(reader, request_reader)
+        start = time.ticks_us()
+        result = handle_request(conn, request)
+        metrics.request_latency(request.path).observe(time.ticks_diff(time.ticks_us(), start))
+        if result is True:
+            keep_open = True
+        elif result:
+            # Streamed body, closed early if the client goes away
+            try:
+                for chunk in result:
+                    writer.write(chunk)
+                    await writer.drain()
+            finally:
+                result.close()
+    except HTTPError as e:
+        send_response(conn, {"error": e.message}, e.status)
+    except Exception as e:
+        print("Request handling error:", e)
+    finally:
+        if request_reader is not None:
+            readers.append(request_reader)
+        gc_manager.activity()
+
+    if keep_open:
+        # The event hub owns the connection until the client goes away
+        try:
+            while await reader.read(64):
+                pass
+        except Exception:
+            pass
+        event_hub.disconnect(conn)
+        return
+
+    try:
+        await writer.drain()
+    except Exception:
+        pass
+    writer.close()
+    await writer.wait_closed()
+
+async def _events(device_manager):
+    timeout = config.HTTP_TIMEOUT / 1000
+    while True:
+        if event_hub.subscribers:
+            device_manager.publish_actuator_changes()
+            event_hub.flush()
+            for subscriber in event_hub.subscribers[:]:
+                if not subscriber.conn.backlog():
+                    continue
+                try:
+                    await asyncio.wait_for(subscriber.conn.writer.drain(), timeout)
+                except Exception:
+                    event_hub.drop(subscriber)
+        await asyncio.sleep(config.UPDATE_INTERVAL / 1000)
+
+async def _dns_server(dns_response, ap_ip):
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('0.0.0.0', config.DNS_PORT))
+    server.setblocking(False)
+    ip_bytes = bytes(map(int, ap_ip.split('.')))
+
+    while True:
+        try:
+            data, address = server.recvfrom(512)
+        except OSError:
+            await asyncio.sleep(config.DNS_POLL_INTERVAL / 1000)
+            continue
+        try:
+            server.sendto(dns_response(data, ip_bytes), address)
+        except OSError as e:
+            print("DNS error:", e)
+
+async def _main(device_manager, handle_request, dns_response, ap_ip):
+    def client(reader, writer):
+        return _serve_client(reader, writer, handle_request)
+
+    for _ in range(config.HTTP_MAX_CLIENTS):
+        readers.append(RequestReader())
+
+    await asyncio.start_server(client, "0.0.0.0", config.HTTP_PORT)
+    tasks = [
+        asyncio.create_task(_dns_server(dns_response, ap_ip)),
+        asyncio.create_task(_every(config.UPDATE_INTERVAL, device_manager.update_actuators)),
+        asyncio.create_task(_every(config.UPDATE_INTERVAL, _update_sensors(device_manager))),
+        asyncio.create_task(_every(config.AUTOMATION_INTERVAL, device_manager.update_automations)),
+        asyncio.create_task(_every(config.SCHEDULER_INTERVAL, scheduler.run_pending)),
+        asyncio.create_task(_every(config.HISTORY_INTERVAL, sensor_history.record)),
+        asyncio.create_task(_every(config.DATALOG_INTERVAL, datalogger.record)),
+        asyncio.create_task(_events(device_manager)),
+        asyncio.create_task(_every(config.GC_POLL_INTERVAL, gc_manager.poll)),
+    ]
+
+    if config.DEBUG:
+        print(f'asyncio runtime started with {len(tasks)} tasks')
+
+    await asyncio.gather(*tasks)
+
+def run(device_manager, handle_request, dns_response, ap_ip='192.168.0.1'):
+    """Run the HTTP server, DNS responder and device loops as cooperative tasks"""
+    asyncio.run(_main(device_manager, handle_request, dns_response, ap_ip))
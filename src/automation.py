@@ -0,0 +1,367 @@
+import time
+import micropython
+from machine import Pin
+
+import config
+import wallclock
+from history import SKIP_STATUSES
+
+# Comparison operators for State conditions
+def _gt(value, threshold):
+    return value > threshold
+
+def _lt(value, threshold):
+    return value < threshold
+
+def _ge(value, threshold):
+    return value >= threshold
+
+def _le(value, threshold):
+    return value <= threshold
+
+def _eq(value, threshold):
+    return abs(value - threshold) < 0.001
+
+OPERATORS = {
+    '>': _gt,
+    '<': _lt,
+    '>=': _ge,
+    '<=': _le,
+    '==': _eq
+}
+
+# Direction the release threshold moves for a hysteresis band
+HYSTERESIS_SIGN = {
+    '>': -1,
+    '>=': -1,
+    '<': 1,
+    '<=': 1
+}
+
+class StateCondition:
+    """Sensor field compared against a threshold
+
+    'hysteresis' widens the threshold once the condition is met so it only
+    releases past the band, 'min_hold_ms' delays each change until it has
+    held that long and 'edge' (rising/falling) fires once per change instead
+    of for as long as the condition holds.
+    """
+    def __init__(self, manager, condition):
+        self.manager = manager
+        self.sensor = manager._find_sensor(condition.get('sensor'))
+        self.field = condition.get('field')
+        operator = condition.get('operator')
+        self.operator = OPERATORS.get(operator)
+        self.threshold = condition.get('threshold', 0)
+        hysteresis = condition.get('hysteresis', 0)
+        self.release_threshold = self.threshold + HYSTERESIS_SIGN.get(operator, 0) * hysteresis
+        self.edge = condition.get('edge')
+        self.min_hold_ms = condition.get('min_hold_ms', 0)
+        self.active = False
+        self.pending_since = None
+        # Re-evaluated when this sensor produces a reading
+        self.source = self.sensor
+
+    def init(self):
+        pass
+
+    def recheck(self):
+        return False
+
+    def check(self, now):
+        if self.sensor is None or self.operator is None:
+            return False
+
+        reading = self.manager.read_sensor(self.sensor)
+        if not reading or self.field not in reading:
+            return False
+        if reading.get('status') in SKIP_STATUSES:
+            return False
+
+        value = reading[self.field]
+        if self.active:
+            met = self.operator(value, self.release_threshold)
+        else:
+            met = self.operator(value, self.threshold)
+
+        changed = False
+        if met == self.active:
+            self.pending_since = None
+        elif self.min_hold_ms and self.pending_since is None:
+            self.pending_since = now
+        elif not self.min_hold_ms or time.ticks_diff(now, self.pending_since) >= self.min_hold_ms:
+            self.active = met
+            self.pending_since = None
+            changed = True
+
+        if self.edge == 'rising':
+            return changed and self.active
+        if self.edge == 'falling':
+            return changed and not self.active
+        return self.active
+
+class SignalCondition:
+    def __init__(self, manager, condition):
+        self.events = manager.events
+        self.signal = condition.get('signal')
+        self.source = self.signal
+
+    def init(self):
+        pass
+
+    def recheck(self):
+        return False
+
+    def check(self, now):
+        if self.events.get(self.signal):
+            self.events[self.signal] = False
+            return True
+        return False
+
+EDGES = {
+    'rising': Pin.IRQ_RISING,
+    'falling': Pin.IRQ_FALLING,
+    'both': Pin.IRQ_RISING | Pin.IRQ_FALLING
+}
+
+class PhysicalCondition:
+    """Pin condition fed by Pin.irq instead of polling
+
+    With 'edge' set the condition fires once per debounced edge, otherwise
+    it holds while the pin is at the 'trigger_high' level.
+    """
+    def __init__(self, manager, condition):
+        self.manager = manager
+        self.pin_num = condition.get('pin', -1)
+        self.level = 1 if condition.get('trigger_high', True) else 0
+        self.edge = condition.get('edge')
+        self.debounce_ms = condition.get('debounce_ms', config.PHYSICAL_DEBOUNCE_MS)
+        self.pin = None
+        self.value = -1
+        self.triggered = False
+        self.settling = False
+        self.last_edge = 0
+        self.source = self
+        # Bound once so the interrupt handler does not allocate
+        self._on_edge = self.on_edge
+
+    def init(self):
+        if self.pin_num < 0:
+            return
+        if self.edge is not None and self.edge not in EDGES:
+            print(f"Unknown edge '{self.edge}' for pin {self.pin_num}")
+            return
+
+        self.pin = Pin(self.pin_num, Pin.IN, Pin.PULL_UP)
+        self.value = self.pin.value()
+        self.last_edge = time.ticks_ms()
+        trigger = EDGES[self.edge] if self.edge else EDGES['both']
+        self.pin.irq(handler=self._irq, trigger=trigger, hard=True)
+
+    def recheck(self):
+        """Level conditions keep being evaluated while held or settling"""
+        return self.edge is None and (self.settling or self.value == self.level)
+
+    def _irq(self, pin):
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_edge) < self.debounce_ms:
+            return
+        self.last_edge = now
+        micropython.schedule(self._on_edge, pin.value())
+
+    def on_edge(self, value):
+        self.value = value
+        self.triggered = True
+        self.settling = True
+        self.manager.mark(self)
+
+    def check(self, now):
+        if self.pin is None:
+            return False
+        if self.edge is None:
+            # Edges inside the debounce window were dropped, so take the
+            # settled level once it has passed
+            if self.settling and time.ticks_diff(now, self.last_edge) >= self.debounce_ms:
+                self.value = self.pin.value()
+                self.settling = False
+            return self.value == self.level
+        if self.triggered:
+            self.triggered = False
+            return True
+        return False
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+ALL_DAYS = 0x7f
+
+def parse_days(spec):
+    """Cron-like day list ('*', 'mon-fri', 'sat,sun' or [0, 6]) to a bit mask"""
+    if isinstance(spec, list):
+        mask = 0
+        for day in spec:
+            mask |= parse_days(str(day))
+        return mask
+    if spec in ('*', ''):
+        return ALL_DAYS
+
+    mask = 0
+    for part in spec.lower().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            first, last = _day_index(first), _day_index(last)
+            day = first
+            while True:
+                mask |= 1 << day
+                if day == last:
+                    break
+                day = (day + 1) % 7
+        else:
+            mask |= 1 << _day_index(part)
+    return mask
+
+def _day_index(day):
+    day = day.strip()
+    if day.isdigit():
+        return int(day) % 7
+    return DAY_NAMES.index(day[:3])
+
+def parse_time(text):
+    """'HH:MM' or 'HH:MM:SS' to seconds into the day"""
+    parts = [int(part) for part in str(text).split(':')]
+    while len(parts) < 3:
+        parts.append(0)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+class ScheduleCondition:
+    """Fires at wall-clock times on selected days
+
+    'times' lists the instants to fire at; without it the condition fires
+    at 'start_time' (seconds into the day), or straight away when the unit
+    starts inside the 'start_time'..'end_time' window.
+    """
+    def __init__(self, manager, condition):
+        self.manager = manager
+        self.days = parse_days(condition.get('days', '*'))
+        times = condition.get('times')
+        if times:
+            self.times = sorted(parse_time(t) for t in times)
+            self.end_time = None
+        else:
+            self.times = [condition.get('start_time', 0)]
+            self.end_time = condition.get('end_time', wallclock.SECONDS_PER_DAY)
+        self.fired = False
+        self.source = self
+
+    def init(self):
+        wallclock.wheel.add(self)
+        if self.end_time is not None and self._in_window(wallclock.now()):
+            self.fire(None)
+
+    def recheck(self):
+        return False
+
+    def _in_window(self, now):
+        day_start = now - now % wallclock.SECONDS_PER_DAY
+        if not self.days & (1 << wallclock.weekday(day_start)):
+            return False
+        return self.times[0] <= now - day_start <= self.end_time
+
+    def next_fire(self, now):
+        day_start = now - now % wallclock.SECONDS_PER_DAY
+        weekday = wallclock.weekday(day_start)
+        for offset in range(8):
+            if self.days & (1 << (weekday + offset) % 7):
+                for t in self.times:
+                    at = day_start + offset * wallclock.SECONDS_PER_DAY + t
+                    if at > now:
+                        return at
+        return None
+
+    def fire(self, at):
+        self.fired = True
+        self.manager.mark(self)
+
+    def check(self, now):
+        if self.fired:
+            self.fired = False
+            return True
+        return False
+
+CONDITIONS = {
+    'State': StateCondition,
+    'Signal': SignalCondition,
+    'Physical': PhysicalCondition,
+    'Schedule': ScheduleCondition
+}
+
+class ControlAction:
+    def __init__(self, action):
+        self.device = action.get('device')
+        self.method = action.get('method')
+        self.params = parse_params(action.get('params', ''))
+
+    def run(self, manager):
+        # Skip calls that would leave the actuator as it is
+        if not self.params and manager.in_target_state(self.device, self.method):
+            return 0
+        manager.invoke_actuator_method(self.device, self.method, self.params)
+        return 0
+
+class SignalAction:
+    def __init__(self, action):
+        self.signal = action.get('signal')
+
+    def run(self, manager):
+        manager.trigger_event(self.signal)
+        return 0
+
+class DelayAction:
+    def __init__(self, action):
+        self.delay_ms = action.get('delay_ms', 1000)
+
+    def run(self, manager):
+        return self.delay_ms
+
+ACTIONS = {
+    'Control': ControlAction,
+    'Signal': SignalAction,
+    'Delay': DelayAction
+}
+
+def parse_params(params_str):
+    """Parse an action's 'key=value&...' params string"""
+    params = {}
+    if params_str:
+        for pair in params_str.split('&'):
+            if '=' in pair:
+                key, value = pair.split('=', 1)
+                params[key] = value
+    return params
+
+class Automation:
+    """An automation compiled into a condition evaluator and action list"""
+    def __init__(self, manager, data):
+        self.name = data['name']
+        self.description = data.get('description', '')
+        self.enabled = data.get('enabled', True)
+        self.cooldown_ms = data.get('cooldown_ms', 1000)
+        self.last_trigger_time = 0
+        self.dirty = False
+
+        condition = data.get('condition', {})
+        self.condition_type = condition.get('type')
+        condition_class = CONDITIONS.get(self.condition_type)
+        self.condition = condition_class(manager, condition) if condition_class else None
+
+        self.actions = []
+        for action in data.get('actions', []):
+            action_class = ACTIONS.get(action.get('type'))
+            if action_class:
+                self.actions.append(action_class(action))
+
+    def check(self, now):
+        if self.condition is None:
+            return False
+        return self.condition.check(now)
+
+    def ready(self, now):
+        return time.ticks_diff(now, self.last_trigger_time) > self.cooldown_ms
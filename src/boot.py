@@ -4,7 +4,16 @@ import os
 import sys
 import machine
 
+# Prefer modules cross-compiled by tools/build_mpy.py over source files.
+# This has to run before importing any of them.
+try:
+    os.stat('/mpy')
+    sys.path.insert(0, '/mpy')
+except OSError:
+    pass
+
 import config
+import boot_report
 
 esp.osdebug(None)
 gc.enable()
@@ -67,5 +76,6 @@ def boot_banner():
 if not config.DEBUG:
     boot_banner = lambda: None
 
-boot_banner()
+with boot_report.report.phase('boot.py'):
+    boot_banner()
 
@@ -0,0 +1,80 @@
+import json
+import time
+import machine
+
+# ESP32 RTC user memory survives soft resets and deep sleep
+RTC_MEMORY_SIZE = 2048
+
+class Phase:
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.phases.append((self.name, time.ticks_diff(time.ticks_us(), self.start)))
+        return False
+
+class BootReport:
+    """Per-phase boot timings, kept in RTC memory for the next boot"""
+    def __init__(self):
+        self.start_us = time.ticks_us()
+        self.start_ms = time.ticks_ms()
+        self.phases = []
+        self.devices = []
+        self.reset_cause = machine.reset_cause()
+        self.total_us = None
+        self.previous = self._load()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add_device(self, name, duration_us):
+        self.devices.append((name, duration_us))
+
+    def finish(self):
+        """Close the report once the unit is ready to serve"""
+        self.total_us = time.ticks_diff(time.ticks_us(), self.start_us)
+        self._save()
+        if self.phases:
+            slowest = max(self.phases, key=lambda p: p[1])
+            print(f'Boot took {self.total_us // 1000}ms (slowest: {slowest[0]} {slowest[1] // 1000}ms)')
+
+    def _summary(self):
+        return {
+            'reset_cause': self.reset_cause,
+            'boot_start_ms': self.start_ms,
+            'total_us': self.total_us,
+            'phases': [{'name': name, 'us': us} for name, us in self.phases],
+            'devices': [{'name': name, 'us': us} for name, us in self.devices]
+        }
+
+    def to_dict(self):
+        report = self._summary()
+        report['previous'] = self.previous
+        return report
+
+    def _load(self):
+        try:
+            data = machine.RTC().memory()
+            return json.loads(data) if data else None
+        except Exception:
+            return None
+
+    def _save(self):
+        try:
+            data = json.dumps(self._summary())
+            if len(data) > RTC_MEMORY_SIZE:
+                # Keep the phases, the per-device list is the part that grows
+                summary = self._summary()
+                summary['devices'] = []
+                data = json.dumps(summary)
+            machine.RTC().memory(data.encode())
+        except Exception as e:
+            print(f'Failed to save boot report: {e}')
+
+report = BootReport()
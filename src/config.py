@@ -7,3 +7,44 @@ WIFI_AP_PASSWORD = "Un!t001ESP32Dev"
 
 UPDATE_INTERVAL = 50
 AUTOMATION_INTERVAL = 100
+SCHEDULER_INTERVAL = 10
+GC_INTERVAL = 10000
+GC_POLL_INTERVAL = 250
+GC_IDLE_MS = 200
+GC_THRESHOLD_PERCENT = 25
+GC_MIN_FREE = 16384
+SENSOR_CACHE_TTL = 1000
+PHYSICAL_DEBOUNCE_MS = 50
+PATTERN_TIMER_ID = 0
+PATTERN_TICK_MS = 10
+
+RUNTIME = "thread"  # "thread" or "asyncio"
+HTTP_PORT = 80
+HTTP_TIMEOUT = 5000
+HTTP_BUFFER_SIZE = 4096
+HTTP_RESPONSE_BUFFER_SIZE = 4096
+HTTP_MAX_CLIENTS = 4
+SERVER_POLL_INTERVAL = 50
+
+HISTORY_INTERVAL = 10000
+HISTORY_DEPTH = 90
+HISTORY_MINUTE_DEPTH = 60
+HISTORY_HOUR_DEPTH = 24
+
+CONFIG_DIR = "/configs"
+
+DATALOG_DIR = "/log"
+DATALOG_INTERVAL = 60000
+DATALOG_BATCH_RECORDS = 64
+DATALOG_SEGMENT_SIZE = 16384
+DATALOG_MAX_SEGMENTS = 8
+DATALOG_CHUNK_SIZE = 512
+
+SSE_MAX_SUBSCRIBERS = 2
+SSE_DEFAULT_INTERVAL = 1000
+SSE_MIN_INTERVAL = 250
+SSE_KEEPALIVE_INTERVAL = 15000
+SSE_MAX_BACKLOG = 1024
+DNS_PORT = 53
+DNS_POLL_INTERVAL = 50
+
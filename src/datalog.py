@@ -0,0 +1,204 @@
+import os
+import time
+import struct
+import _thread
+
+import config
+from history import SKIP_STATUSES
+
+# timestamp (s), sensor id, field id, value
+RECORD_FORMAT = '<IBBf'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+SEGMENT_SUFFIX = '.bin'
+
+class DataLogger:
+    """Batched, append-only flash log of sensor readings"""
+    def __init__(self, directory=None):
+        self.directory = directory or config.DATALOG_DIR
+        self.batch = bytearray(config.DATALOG_BATCH_RECORDS * RECORD_SIZE)
+        self.batch_mv = memoryview(self.batch)
+        self.batch_length = 0
+        # record() runs in the main loop, exports flush from the server thread
+        self.lock = _thread.allocate_lock()
+        self.chunk = bytearray(config.DATALOG_CHUNK_SIZE)
+        self.chunk_mv = memoryview(self.chunk)
+        self.sensors = []
+        self.segments = []
+        # Segments are not deleted while an export may still read them
+        self.exports = 0
+
+    def build(self, device_manager):
+        """Assign ids to every numeric field and open the segment list"""
+        # Fields are filled in once a sensor has read, its driver loads on first use
+        self.sensors = []
+        for sensor_id, ctx in enumerate(device_manager.sensor_contexts):
+            self.sensors.append((sensor_id, ctx, None))
+
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass  # Already exists
+        self.segments = sorted(name for name in os.listdir(self.directory)
+                               if name.endswith(SEGMENT_SUFFIX)
+                               and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        if not self.segments:
+            self.segments.append(self._segment_name(0))
+
+    def _segment_name(self, index):
+        return '%06d%s' % (index, SEGMENT_SUFFIX)
+
+    def _path(self, name):
+        return self.directory + '/' + name
+
+    def record(self):
+        """Append the cached reading of every sensor to the batch"""
+        timestamp = int(time.time())
+        with self.lock:
+            self._record(timestamp)
+
+    def _fields(self, ctx):
+        meta = getattr(ctx.driver, 'METADATA', {})
+        return [r['name'] for r in meta.get('readings', [])
+                if r['type'] in ('float', 'int')]
+
+    def _record(self, timestamp):
+        for i, (sensor_id, ctx, fields) in enumerate(self.sensors):
+            reading = ctx.reading
+            if reading is None:
+                continue
+            if fields is None:
+                fields = self._fields(ctx)
+                self.sensors[i] = (sensor_id, ctx, fields)
+            if reading.get('status') in SKIP_STATUSES:
+                continue
+            for field_id, field in enumerate(fields):
+                value = reading.get(field)
+                if value is None:
+                    continue
+                if self.batch_length + RECORD_SIZE > len(self.batch):
+                    self._flush()
+                struct.pack_into(RECORD_FORMAT, self.batch, self.batch_length,
+                                 timestamp, sensor_id, field_id, value)
+                self.batch_length += RECORD_SIZE
+
+    def flush(self):
+        """Write the pending batch to the active segment in one append"""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.batch_length:
+            return
+        try:
+            with open(self._path(self.segments[-1]), 'ab') as f:
+                f.write(self.batch_mv[:self.batch_length])
+        except OSError as e:
+            print(f'Datalog write error: {e}')
+            return
+        finally:
+            self.batch_length = 0
+        self._rotate()
+
+    def _rotate(self):
+        if self._size(self.segments[-1]) < config.DATALOG_SEGMENT_SIZE:
+            return
+        index = int(self.segments[-1][:-len(SEGMENT_SUFFIX)]) + 1
+        self.segments.append(self._segment_name(index))
+        if not self.exports:
+            self._trim()
+
+    def _trim(self):
+        while len(self.segments) > config.DATALOG_MAX_SEGMENTS:
+            oldest = self.segments.pop(0)
+            try:
+                os.remove(self._path(oldest))
+            except OSError:
+                pass
+
+    def _size(self, name):
+        try:
+            return os.stat(self._path(name))[6]
+        except OSError:
+            return 0
+
+    def schema(self):
+        with self.lock:
+            segments = self.segments[:]
+        return {
+            'record_format': RECORD_FORMAT,
+            'record_size': RECORD_SIZE,
+            'sensors': [{'id': sensor_id, 'name': ctx.name, 'fields': fields or []}
+                        for sensor_id, ctx, fields in self.sensors],
+            'segments': [{'name': name, 'size': self._size(name)} for name in segments]
+        }
+
+    def export(self):
+        """Flush and snapshot the log, returns an Export of everything recorded so far"""
+        with self.lock:
+            self._flush()
+            segments = [(name, self._size(name)) for name in self.segments]
+            self.exports += 1
+        return Export(self, segments)
+
+    def _export_done(self):
+        with self.lock:
+            self.exports -= 1
+            if not self.exports:
+                self._trim()
+
+class Export:
+    """Iterator over snapshotted segments, each read only up to its snapshot size
+
+    close() must be called if it is not read to the end, deletions of old
+    segments wait for it.
+    """
+    def __init__(self, logger, segments):
+        self.logger = logger
+        self.segments = segments
+        self.length = sum(size for _, size in segments)
+        self.file = None
+        self.remaining = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            return self._read()
+        except Exception:
+            # Includes StopIteration at the end
+            self.close()
+            raise
+
+    def _read(self):
+        logger = self.logger
+        while self.file is None:
+            if not self.segments:
+                raise StopIteration
+            name, self.remaining = self.segments.pop(0)
+            if self.remaining:
+                self.file = open(logger._path(name), 'rb')
+
+        count = self.file.readinto(logger.chunk_mv[:min(self.remaining, len(logger.chunk))])
+        if not count:
+            # The Content-Length sent can no longer be met
+            raise OSError('Segment shrank during export')
+        self.remaining -= count
+        if not self.remaining:
+            self.file.close()
+            self.file = None
+        return logger.chunk_mv[:count]
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.logger._export_done()
+
+datalogger = DataLogger()
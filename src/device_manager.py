@@ -1,6 +1,58 @@
+import os
+import sys
 import json
 import time
-from machine import Pin
+import binascii
+import _thread
+
+import config
+import metrics
+from automation import Automation
+from scheduler import scheduler
+from wallclock import wheel
+
+NO_DATA = {}
+
+# Cross-compiled drivers shadow the source ones
+DRIVER_PATHS = ('/mpy/drivers', '/drivers')
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+class DeviceContext:
+    """Per-device config object reused for every driver call"""
+    __slots__ = ('name', 'kind', 'driver_name', 'pins', 'data', 'driver', 'activated',
+                 'update', 'ttl_ms', 'reading', 'state', 'timers')
+    
+    def __init__(self, device, kind):
+        self.name = device['name']
+        self.kind = kind
+        self.driver_name = device['driver']
+        self.pins = device['pins']
+        self.data = NO_DATA
+        self.driver = None
+        self.activated = False
+        self.update = None
+        self.ttl_ms = device.get('ttl_ms', config.SENSOR_CACHE_TTL)
+        self.reading = None
+        self.state = None
+        self.timers = None
+    
+    def bind(self, driver):
+        self.driver = driver
+        self.update = getattr(driver, 'update', None)
+        self.timers = metrics.driver_timers(self.driver_name, driver)
+    
+    # Drivers index their config like a dict
+    def __getitem__(self, key):
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
 
 class DeviceManager:
     def __init__(self):
@@ -10,16 +62,33 @@ class DeviceManager:
         self.drivers = {}
         self.events = {}
         self.loaded_drivers = set()
+        self.actuator_index = {}
+        self.sensor_index = {}
+        self.actuator_contexts = []
+        self.sensor_contexts = []
+        self.listeners = []
+        self.payloads = {}
+        self.init_timings = []
+        # Condition source (sensor context, signal name, pin or schedule condition)
+        # -> automations that depend on it
+        self.dependents = {}
+        self.dirty = []
+        # Held while a device is activated, both server and main loop may be first
+        self.lock = _thread.allocate_lock()
         
     def load_devices(self):
-        self.load_actuators('/configs/actuators.json')
-        self.load_sensors('/configs/sensors.json')
+        self.load_actuators(config.CONFIG_DIR + '/actuators.json')
+        self.load_sensors(config.CONFIG_DIR + '/sensors.json')
         
-        for actuator in self.actuators:
-            self._load_driver(actuator['driver'])
-        
-        for sensor in self.sensors:
-            self._load_driver(sensor['driver'])
+        # Drivers are imported and devices initialized on first use, see activate()
+        self._build_registry()
+    
+    def _build_registry(self):
+        self.actuator_contexts = [DeviceContext(a, 'actuator') for a in self.actuators]
+        self.sensor_contexts = [DeviceContext(s, 'sensor') for s in self.sensors]
+        self.actuator_index = {ctx.name: ctx for ctx in self.actuator_contexts}
+        self.sensor_index = {ctx.name: ctx for ctx in self.sensor_contexts}
+        self.payloads = {}
     
     def load_actuators(self, path):
         try:
@@ -43,24 +112,47 @@ class DeviceManager:
         try:
             with open(path, 'r') as f:
                 data = json.load(f)
-                for automation in data:
-                    automation['last_trigger_time'] = 0
-                    automation['enabled'] = automation.get('enabled', True)
-                    automation['cooldown_ms'] = automation.get('cooldown_ms', 1000)
-                self.automations = data
+                self.automations = [Automation(self, automation) for automation in data]
+                self._index_automations()
+                self.payloads.pop('automations', None)
                 print(f'Loaded {len(self.automations)} automations')
         except Exception as e:
             print(f'Failed to load automations: {e}')
     
+    def _index_automations(self):
+        self.dependents = {}
+        self.dirty = []
+        
+        for automation in self.automations:
+            if automation.condition is None or automation.condition.source is None:
+                continue
+            source = automation.condition.source
+            if source not in self.dependents:
+                self.dependents[source] = []
+            self.dependents[source].append(automation)
+            # Evaluate everything once on the first pass
+            self._mark_automation(automation)
+    
+    def mark(self, source):
+        """Queue the automations that depend on source for the next pass"""
+        automations = self.dependents.get(source)
+        if automations:
+            for automation in automations:
+                self._mark_automation(automation)
+    
+    def _mark_automation(self, automation):
+        if not automation.dirty:
+            automation.dirty = True
+            self.dirty.append(automation)
+    
     def _load_driver(self, driver_name):
         if driver_name in self.loaded_drivers:
             return True
         
         try:
-            import sys
-            
-            if '/drivers' not in sys.path:
-                sys.path.append('/drivers')
+            for path in DRIVER_PATHS:
+                if path not in sys.path and _exists(path):
+                    sys.path.append(path)
             
             module = __import__(driver_name)
             
@@ -70,174 +162,105 @@ class DeviceManager:
             return True
         except Exception as e:
             print(f'Failed to load driver {driver_name}: {e}')
-            import sys
             sys.print_exception(e)
             return False
     
-    def init_devices(self):
-        for actuator in self.actuators:
-            self._init_actuator(actuator)
-        
-        for sensor in self.sensors:
-            self._init_sensor(sensor)
+    def _get_driver(self, driver_name):
+        if not self._load_driver(driver_name):
+            return None
+        return self.drivers[driver_name]
     
-    def _init_actuator(self, actuator):
-        try:
-            driver = self.drivers.get(actuator['driver'])
-            if driver and hasattr(driver, 'init'):
-                config = {
-                    'name': actuator['name'],
-                    'pins': actuator['pins']
-                }
-                driver.init(config)
-                print(f"Initialized actuator: {actuator['name']}")
-        except Exception as e:
-            print(f"Failed to initialize actuator {actuator['name']}: {e}")
+    def activate(self, ctx):
+        """Import the driver and init the device on first use, returns the driver"""
+        if not ctx.activated:
+            with self.lock:
+                if not ctx.activated:
+                    self._init_device(ctx)
+        return ctx.driver
     
-    def _init_sensor(self, sensor):
+    def _init_device(self, ctx):
+        start = time.ticks_us()
         try:
-            driver = self.drivers.get(sensor['driver'])
-            if driver and hasattr(driver, 'init'):
-                config = {
-                    'name': sensor['name'],
-                    'pins': sensor['pins']
-                }
-                driver.init(config)
-                print(f"Initialized sensor: {sensor['name']}")
+            ctx.bind(self._get_driver(ctx.driver_name))
+            if ctx.driver and hasattr(ctx.driver, 'init'):
+                ctx.driver.init(ctx)
+                print(f"Initialized {ctx.kind}: {ctx.name}")
         except Exception as e:
-            print(f"Failed to initialize sensor {sensor['name']}: {e}")
+            print(f"Failed to initialize {ctx.kind} {ctx.name}: {e}")
+        finally:
+            # Tried once, a failing device is not retried on every use
+            ctx.activated = True
+            self.init_timings.append((ctx.name, time.ticks_diff(time.ticks_us(), start)))
     
     def init_automations(self):
         for automation in self.automations:
-            condition = automation.get('condition', {})
-            if condition.get('type') == 'Physical':
-                pin = condition.get('pin', -1)
-                if pin >= 0:
-                    Pin(pin, Pin.IN, Pin.PULL_UP)
-                    print(f"Initialized physical pin {pin} for automation {automation['name']}")
+            if automation.condition is not None:
+                automation.condition.init()
     
     def update_actuators(self):
-        for actuator in self.actuators:
+        self._update_devices(self.actuator_contexts)
+    
+    def update_sensors(self):
+        self._update_devices(self.sensor_contexts)
+    
+    def _update_devices(self, contexts):
+        for ctx in contexts:
+            if not ctx.activated:
+                self.activate(ctx)
+            if ctx.update is None:
+                continue
+            start = time.ticks_us()
             try:
-                driver = self.drivers.get(actuator['driver'])
-                if driver and hasattr(driver, 'update'):
-                    config = {
-                        'name': actuator['name'],
-                        'pins': actuator['pins']
-                    }
-                    driver.update(config)
+                ctx.update(ctx)
             except Exception as e:
                 pass  # Silent update errors
+            ctx.timers[1].observe(time.ticks_diff(time.ticks_us(), start))
     
     def update_automations(self):
         current_time = time.ticks_ms()
         
-        for automation in self.automations:
-            if not automation.get('enabled', True):
-                continue
-            
-            should_trigger = False
-            condition = automation.get('condition', {})
-            condition_type = condition.get('type')
-            
-            if condition_type == 'State':
-                should_trigger = self._check_state_condition(automation)
-            elif condition_type == 'Signal':
-                should_trigger = self._check_signal_condition(automation)
-            elif condition_type == 'Physical':
-                should_trigger = self._check_physical_condition(automation)
-            elif condition_type == 'Schedule':
-                should_trigger = self._check_schedule_condition(automation, current_time)
-            
-            cooldown = automation.get('cooldown_ms', 1000)
-            if should_trigger and time.ticks_diff(current_time, automation['last_trigger_time']) > cooldown:
-                print(f"Triggering automation: {automation['name']}")
-                self._execute_automation_actions(automation)
-                automation['last_trigger_time'] = current_time
-    
-    def _check_state_condition(self, automation):
-        condition = automation.get('condition', {})
-        sensor_name = condition.get('sensor')
-        field = condition.get('field')
-        operator = condition.get('operator')
-        threshold = condition.get('threshold', 0)
-        
-        reading = self.get_sensor_reading(sensor_name)
-        if not reading or field not in reading:
-            return False
-        
-        value = reading[field]
-        
-        if operator == '>':
-            return value > threshold
-        elif operator == '<':
-            return value < threshold
-        elif operator == '>=':
-            return value >= threshold
-        elif operator == '<=':
-            return value <= threshold
-        elif operator == '==':
-            return abs(value - threshold) < 0.001
+        # Due schedules mark themselves dirty
+        wheel.poll()
         
-        return False
-    
-    def _check_signal_condition(self, automation):
-        condition = automation.get('condition', {})
-        signal_name = condition.get('signal')
-        
-        if signal_name in self.events and self.events[signal_name]:
-            self.events[signal_name] = False
-            return True
-        return False
+        # Only what was marked before this pass; marks made while evaluating
+        # (or from other threads) wait for the next one
+        dirty = self.dirty
+        for _ in range(len(dirty)):
+            automation = dirty.pop(0)
+            automation.dirty = False
+            if (self._evaluate(automation, current_time) is False
+                    or automation.enabled and automation.condition.recheck()):
+                # Cooling down or held at a level, look again next pass
+                self._mark_automation(automation)
     
-    def _check_physical_condition(self, automation):
-        condition = automation.get('condition', {})
-        pin_num = condition.get('pin', -1)
-        trigger_high = condition.get('trigger_high', True)
+    def _evaluate(self, automation, now):
+        """Check and run an automation, False while it is cooling down"""
+        if not automation.enabled:
+            return None
         
-        if pin_num < 0:
+        # Cooling down automations are not checked, so edge conditions
+        # see the change once the cooldown has passed
+        if not automation.ready(now):
             return False
+        metrics.automation_evaluations.inc()
+        if not automation.check(now):
+            return None
         
-        pin = Pin(pin_num, Pin.IN, Pin.PULL_UP)
-        pin_state = pin.value()
-        
-        return (pin_state == 1) if trigger_high else (pin_state == 0)
-    
-    def _check_schedule_condition(self, automation, current_time):
-        condition = automation.get('condition', {})
-        start_time = condition.get('start_time', 0)
-        end_time = condition.get('end_time', 86400)
-        
-        seconds_in_day = (current_time // 1000) % 86400
-        return start_time <= seconds_in_day <= end_time
+        print(f"Triggering automation: {automation.name}")
+        metrics.automation_triggers.inc()
+        self._run_actions((automation.actions, 0))
+        automation.last_trigger_time = now
+        return True
     
-    def _execute_automation_actions(self, automation):
-        actions = automation.get('actions', [])
+    def _run_actions(self, continuation):
+        actions, index = continuation
         
-        for action in actions:
-            action_type = action.get('type')
-            
-            if action_type == 'Control':
-                device_name = action.get('device')
-                method = action.get('method')
-                params_str = action.get('params', '')
-                
-                params = {}
-                if params_str:
-                    for pair in params_str.split('&'):
-                        if '=' in pair:
-                            key, value = pair.split('=', 1)
-                            params[key] = value
-                
-                self.invoke_actuator_method(device_name, method, params)
-                
-            elif action_type == 'Signal':
-                signal_name = action.get('signal')
-                self.trigger_event(signal_name)
-                
-            elif action_type == 'Delay':
-                delay_ms = action.get('delay_ms', 1000)
-                time.sleep_ms(delay_ms)
+        for i in range(index, len(actions)):
+            delay_ms = actions[i].run(self)
+            if delay_ms:
+                # Resume the remaining actions later instead of sleeping
+                scheduler.call_later(delay_ms, self._run_actions, (actions, i + 1))
+                return
     
     def get_actuator_names(self):
         return [a['name'] for a in self.actuators]
@@ -246,97 +269,171 @@ class DeviceManager:
         return [s['name'] for s in self.sensors]
     
     def get_actuator_state(self, name):
-        actuator = self._find_actuator(name)
-        if not actuator:
+        ctx = self.actuator_index.get(name)
+        if not ctx:
             return None
         
-        driver = self.drivers.get(actuator['driver'])
+        driver = self.activate(ctx)
         if not driver or not hasattr(driver, 'get_states'):
             return None
         
         try:
-            config = {
-                'name': actuator['name'],
-                'pins': actuator['pins']
-            }
-            return driver.get_states(config)
+            return driver.get_states(ctx)
         except Exception as e:
             print(f'Error getting actuator state: {e}')
             return None
     
     def get_sensor_reading(self, name):
-        sensor = self._find_sensor(name)
-        if not sensor:
+        ctx = self.sensor_index.get(name)
+        if not ctx:
             return None
+        return self.read_sensor(ctx)
+    
+    def read_sensor(self, ctx):
+        now = time.ticks_ms()
+        reading = ctx.reading
+        if reading is not None:
+            age = time.ticks_diff(now, reading['timestamp'])
+            if age < ctx.ttl_ms:
+                reading['age_ms'] = age
+                return reading
         
-        driver = self.drivers.get(sensor['driver'])
+        driver = self.activate(ctx)
         if not driver or not hasattr(driver, 'read'):
             return None
         
+        start = time.ticks_us()
         try:
-            config = {
-                'name': sensor['name'],
-                'pins': sensor['pins']
-            }
-            return driver.read(config)
+            reading = driver.read(ctx)
         except Exception as e:
             print(f'Error reading sensor: {e}')
             return None
+        finally:
+            ctx.timers[0].observe(time.ticks_diff(time.ticks_us(), start))
+        
+        if reading is None:
+            return None
+        
+        reading['timestamp'] = time.ticks_ms()
+        reading['age_ms'] = 0
+        ctx.reading = reading
+        self.mark(ctx)
+        self._notify('sensor', ctx.name, reading)
+        return reading
+    
+    def get_all_sensor_readings(self):
+        readings = {}
+        for ctx in self.sensor_contexts:
+            readings[ctx.name] = self.read_sensor(ctx)
+        return readings
+    
+    def get_all_actuator_states(self):
+        states = {}
+        for ctx in self.actuator_contexts:
+            states[ctx.name] = self.get_actuator_state(ctx.name)
+        return states
+    
+    def sample_sensors(self):
+        for ctx in self.sensor_contexts:
+            self.read_sensor(ctx)
     
     def invoke_actuator_method(self, name, method, params=None):
-        actuator = self._find_actuator(name)
-        if not actuator:
+        ctx = self.actuator_index.get(name)
+        if not ctx:
             return False
         
-        driver = self.drivers.get(actuator['driver'])
-        if not driver or not hasattr(driver, method):
+        method_func = getattr(self.activate(ctx), method, None)
+        if method_func is None:
             return False
         
         try:
-            config = {
-                'name': actuator['name'],
-                'pins': actuator['pins'],
-                'data': params or {}
-            }
-            method_func = getattr(driver, method)
-            method_func(config)
+            if params:
+                # The shared context may be in use by another thread
+                method_func({'name': ctx.name, 'pins': ctx.pins, 'data': params})
+            else:
+                method_func(ctx)
+            self._publish_state(ctx)
             return True
         except Exception as e:
             print(f'Error invoking method {method}: {e}')
             return False
     
+    def in_target_state(self, name, method):
+        """True if calling method would not change the actuator's state"""
+        ctx = self.actuator_index.get(name)
+        driver = self.activate(ctx) if ctx else None
+        if driver is None or not hasattr(driver, 'get_states'):
+            return False
+        
+        methods = getattr(driver, 'METADATA', NO_DATA).get('methods', NO_DATA)
+        target = methods.get(method, NO_DATA).get('target')
+        if not target:
+            return False
+        
+        state = driver.get_states(ctx)
+        for key in target:
+            if state.get(key) != target[key]:
+                return False
+        return True
+    
+    def _notify(self, kind, name, data):
+        for listener in self.listeners:
+            listener(kind, name, data)
+    
+    def _publish_state(self, ctx):
+        if not self.listeners or not hasattr(ctx.driver, 'get_states'):
+            return
+        
+        state = ctx.driver.get_states(ctx)
+        if state != ctx.state:
+            ctx.state = state
+            self._notify('actuator', ctx.name, state)
+    
+    def publish_actuator_changes(self):
+        for ctx in self.actuator_contexts:
+            try:
+                self._publish_state(ctx)
+            except Exception as e:
+                print(f'Error getting actuator state: {e}')
+    
+    def publish_snapshot(self):
+        for ctx in self.sensor_contexts:
+            if ctx.reading is not None:
+                self._notify('sensor', ctx.name, ctx.reading)
+        for ctx in self.actuator_contexts:
+            ctx.state = None
+        self.publish_actuator_changes()
+    
     def _find_actuator(self, name):
-        for actuator in self.actuators:
-            if actuator['name'] == name:
-                return actuator
-        return None
+        return self.actuator_index.get(name)
     
     def _find_sensor(self, name):
-        for sensor in self.sensors:
-            if sensor['name'] == name:
-                return sensor
-        return None
+        return self.sensor_index.get(name)
     
     def trigger_event(self, event_name):
         self.events[event_name] = True
+        self.mark(event_name)
         print(f'Event triggered: {event_name}')
     
     def get_automations_list(self):
         result = []
         for automation in self.automations:
             result.append({
-                'name': automation['name'],
-                'description': automation.get('description', ''),
-                'enabled': automation.get('enabled', True),
-                'condition_type': automation.get('condition', {}).get('type')
+                'name': automation.name,
+                'description': automation.description,
+                'enabled': automation.enabled,
+                'condition_type': automation.condition_type
             })
         return result
     
     def toggle_automation(self, name):
         for automation in self.automations:
-            if automation['name'] == name:
-                automation['enabled'] = not automation.get('enabled', True)
-                print(f"Automation {name} {'enabled' if automation['enabled'] else 'disabled'}")
+            if automation.name == name:
+                automation.enabled = not automation.enabled
+                if automation.enabled:
+                    self._mark_automation(automation)
+                self.payloads.pop('automations', None)
+                print(f"Automation {name} {'enabled' if automation.enabled else 'disabled'}")
                 return True
         return False
     
@@ -347,7 +444,7 @@ class DeviceManager:
         }
         
         for actuator in self.actuators:
-            driver = self.drivers.get(actuator['driver'])
+            driver = self._get_driver(actuator['driver'])
             meta = {
                 'name': actuator['name'],
                 'driver': actuator['driver'],
@@ -360,7 +457,7 @@ class DeviceManager:
             metadata['actuators'].append(meta)
         
         for sensor in self.sensors:
-            driver = self.drivers.get(sensor['driver'])
+            driver = self._get_driver(sensor['driver'])
             meta = {
                 'name': sensor['name'],
                 'driver': sensor['driver'],
@@ -372,4 +469,25 @@ class DeviceManager:
             
             metadata['sensors'].append(meta)
         
-        return metadata
\ No newline at end of file
+        return metadata
+    
+    def get_payload(self, key):
+        """Serialized JSON for a config-derived listing, with its ETag"""
+        payload = self.payloads.get(key)
+        if payload is None:
+            if key == 'metadata':
+                data = self.get_metadata()
+            elif key == 'actuators':
+                data = self.get_actuator_names()
+            elif key == 'sensors':
+                data = self.get_sensor_names()
+            elif key == 'automations':
+                data = self.get_automations_list()
+            else:
+                return None
+            
+            body = json.dumps(data).encode()
+            etag = '"%08x"' % (binascii.crc32(body) & 0xFFFFFFFF)
+            payload = (body, etag)
+            self.payloads[key] = payload
+        return payload
@@ -1,5 +1,6 @@
 from machine import Pin, PWM
-import time
+
+from patterns import Pattern, parse_steps, player
 
 # Driver metadata
 METADATA = {
@@ -8,11 +9,13 @@ METADATA = {
             'description': 'Turn buzzer on',
             'params': [
                 {'name': 'frequency', 'type': 'number', 'required': False}
-            ]
+            ],
+            'target': {'state': 'ON', 'pattern_active': False}
         },
         'off': {
             'description': 'Turn buzzer off',
-            'params': []
+            'params': [],
+            'target': {'state': 'OFF', 'pattern_active': False}
         },
         'beep': {
             'description': 'Single beep',
@@ -26,9 +29,25 @@ METADATA = {
             'params': [
                 {'name': 'frequency', 'type': 'number', 'required': True}
             ]
+        },
+        'play': {
+            'description': 'Play a tone pattern',
+            'params': [
+                {'name': 'pattern', 'type': 'string', 'required': False},
+                {'name': 'steps', 'type': 'string', 'required': False},
+                {'name': 'repeat', 'type': 'number', 'required': False}
+            ]
         }
     },
-    'exposed_states': ['state', 'frequency']
+    'exposed_states': ['state', 'frequency', 'pattern_active']
+}
+
+# Named patterns as (frequency, ms) steps, 0 is silence
+PATTERNS = {
+    'double': (2000, 100, 0, 100, 2000, 100, 0, 700),
+    'alarm': (2500, 250, 0, 100, 2500, 250, 0, 400),
+    'siren': (1200, 300, 1800, 300),
+    'chime': (1568, 150, 1319, 150, 1047, 300, 0, 400)
 }
 
 # State storage
@@ -40,7 +59,9 @@ def _get_state(pin):
         states[pin] = {
             'active': False,
             'frequency': 2000,
-            'pwm_obj': None
+            'pwm_obj': None,
+            'output': None,
+            'done': None
         }
     return states[pin]
 
@@ -53,12 +74,28 @@ def init(config):
     state['pwm_obj'] = PWM(Pin(pin), freq=2000, duty=0)
     state['active'] = False
     
+    def output(frequency):
+        if frequency:
+            state['pwm_obj'].freq(frequency)
+            state['pwm_obj'].duty(512)
+            state['frequency'] = frequency
+        else:
+            state['pwm_obj'].duty(0)
+        state['active'] = frequency > 0
+    
+    def done():
+        output(0)
+    
+    state['output'] = output
+    state['done'] = done
+    
     print(f"Buzzer Driver initialized for pin {pin}")
 
 def on(config):
     """Turn buzzer on"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    player.stop(pin)
     data = config.get('data', {})
     
     frequency = int(data.get('frequency', 2000))
@@ -74,6 +111,7 @@ def off(config):
     """Turn buzzer off"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    player.stop(pin)
     
     state['pwm_obj'].duty(0)
     state['active'] = False
@@ -83,21 +121,16 @@ def off(config):
 def beep(config):
     """Single beep"""
     pin = config['pins'][0]
+    state = _get_state(pin)
     data = config.get('data', {})
     
     duration = int(data.get('duration', 200))
     frequency = int(data.get('frequency', 2000))
     
-    # Temporarily turn on
-    config_on = {'pins': [pin], 'data': {'frequency': frequency}}
-    on(config_on)
-    
-    time.sleep_ms(duration)
-    
-    # Turn off
-    off(config)
+    # The pattern timer turns it off again
+    player.play(pin, Pattern(state['output'], (frequency, duration), 1, 0, state['done']))
     
-    print(f"Buzzer on pin {pin} beeped for {duration}ms")
+    print(f"Buzzer on pin {pin} beeping for {duration}ms")
 
 def tone(config):
     """Play specific tone"""
@@ -109,6 +142,25 @@ def tone(config):
     config_on = {'pins': [pin], 'data': {'frequency': frequency}}
     on(config_on)
 
+def play(config):
+    """Play a named pattern or 'frequency:ms,...' steps"""
+    pin = config['pins'][0]
+    state = _get_state(pin)
+    data = config.get('data', {})
+    
+    if 'steps' in data:
+        steps = parse_steps(data['steps'])
+    else:
+        steps = PATTERNS.get(data.get('pattern', 'double'))
+    if not steps:
+        print(f"Buzzer on pin {pin}: unknown pattern")
+        return
+    
+    repeat = int(data.get('repeat', 1))
+    player.play(pin, Pattern(state['output'], steps, repeat, 0, state['done']))
+    
+    print(f"Buzzer on pin {pin} playing pattern")
+
 def get_states(config):
     """Get buzzer states"""
     pin = config['pins'][0]
@@ -116,9 +168,6 @@ def get_states(config):
     
     return {
         'state': 'ON' if state['active'] else 'OFF',
-        'frequency': state['frequency']
+        'frequency': state['frequency'],
+        'pattern_active': player.is_playing(pin)
     }
-
-def update(config):
-    """Update buzzer (no continuous update needed)"""
-    pass
\ No newline at end of file
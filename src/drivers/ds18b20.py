@@ -21,6 +21,10 @@ METADATA = {
     ]
 }
 
+# Conversion timing (12-bit resolution needs up to 750ms)
+CONVERSION_TIME_MS = 750
+CONVERSION_INTERVAL_MS = 1000
+
 # State storage
 sensors = {}
 
@@ -30,10 +34,19 @@ def _get_sensor(pin):
         sensors[pin] = {
             'ds': None,
             'roms': [],
-            'last_conversion': 0
+            'converting': False,
+            'conversion_start': 0,
+            'temperature': -127.0,
+            'status': 'no_sensor'
         }
     return sensors[pin]
 
+def _start_conversion(sensor):
+    """Start a conversion without waiting for it"""
+    sensor['ds'].convert_temp()
+    sensor['converting'] = True
+    sensor['conversion_start'] = time.ticks_ms()
+
 def init(config):
     """Initialize DS18B20 sensor"""
     pin = config['pins'][0]
@@ -48,50 +61,52 @@ def init(config):
         
         print(f"DS18B20: Found {len(sensor['roms'])} sensor(s) on pin {pin}")
         
-        # Initial conversion
+        # Initial conversion, collected by update()
         if sensor['roms']:
-            sensor['ds'].convert_temp()
-            time.sleep_ms(750)
-            sensor['last_conversion'] = time.ticks_ms()
+            sensor['status'] = 'pending'
+            _start_conversion(sensor)
             
     except Exception as e:
         print(f"DS18B20 initialization error on pin {pin}: {e}")
     
     print(f"DS18B20 Driver initialized for pin {pin}")
 
-def read(config):
-    """Read temperature from DS18B20"""
+def update(config):
+    """Advance the conversion state machine"""
     pin = config['pins'][0]
     sensor = _get_sensor(pin)
     
     if not sensor['ds'] or not sensor['roms']:
-        return {
-            'temperature': -127.0,
-            'device_count': 0,
-            'status': 'no_sensor'
-        }
+        return
+    
+    now = time.ticks_ms()
+    elapsed = time.ticks_diff(now, sensor['conversion_start'])
     
     try:
-        # Start conversion if enough time has passed
-        now = time.ticks_ms()
-        if time.ticks_diff(now, sensor['last_conversion']) > 1000:
-            sensor['ds'].convert_temp()
-            time.sleep_ms(750)
-            sensor['last_conversion'] = now
-        
-        # Read temperature from first sensor
-        temp = sensor['ds'].read_temp(sensor['roms'][0])
-        
-        return {
-            'temperature': round(temp, 2),
-            'device_count': len(sensor['roms']),
-            'status': 'ok'
-        }
-        
+        if sensor['converting']:
+            if elapsed < CONVERSION_TIME_MS:
+                return
+            
+            # Read temperature from first sensor
+            temp = sensor['ds'].read_temp(sensor['roms'][0])
+            sensor['converting'] = False
+            sensor['temperature'] = round(temp, 2)
+            sensor['status'] = 'ok'
+        elif elapsed >= CONVERSION_INTERVAL_MS:
+            _start_conversion(sensor)
+            
     except Exception as e:
         print(f"DS18B20 read error on pin {pin}: {e}")
-        return {
-            'temperature': -127.0,
-            'device_count': len(sensor['roms']),
-            'status': 'error'
-        }
\ No newline at end of file
+        sensor['converting'] = False
+        sensor['status'] = 'error'
+
+def read(config):
+    """Read last completed temperature from DS18B20"""
+    pin = config['pins'][0]
+    sensor = _get_sensor(pin)
+    
+    return {
+        'temperature': sensor['temperature'],
+        'device_count': len(sensor['roms']),
+        'status': sensor['status']
+    }
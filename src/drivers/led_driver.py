@@ -1,16 +1,20 @@
 from machine import Pin
 import time
 
+from patterns import Pattern, parse_steps, player
+
 # Driver metadata
 METADATA = {
     'methods': {
         'on': {
             'description': 'Turn LED on',
-            'params': []
+            'params': [],
+            'target': {'state': 'ON', 'blink_active': False}
         },
         'off': {
             'description': 'Turn LED off',
-            'params': []
+            'params': [],
+            'target': {'state': 'OFF', 'blink_active': False}
         },
         'toggle': {
             'description': 'Toggle LED state',
@@ -22,11 +26,28 @@ METADATA = {
                 {'name': 'duration', 'type': 'number', 'required': False},
                 {'name': 'interval', 'type': 'number', 'required': False}
             ]
+        },
+        'pattern': {
+            'description': 'Play a blink pattern',
+            'params': [
+                {'name': 'name', 'type': 'string', 'required': False},
+                {'name': 'steps', 'type': 'string', 'required': False},
+                {'name': 'repeat', 'type': 'number', 'required': False}
+            ]
         }
     },
     'exposed_states': ['state', 'blink_active', 'toggle_count']
 }
 
+# Named patterns as (level, ms) steps
+PATTERNS = {
+    'heartbeat': (1, 100, 0, 150, 1, 100, 0, 650),
+    'sos': (1, 150, 0, 150, 1, 150, 0, 150, 1, 150, 0, 450,
+            1, 450, 0, 150, 1, 450, 0, 150, 1, 450, 0, 450,
+            1, 150, 0, 150, 1, 150, 0, 150, 1, 150, 0, 1050),
+    'flash': (1, 50, 0, 950)
+}
+
 # State storage
 states = {}
 
@@ -41,7 +62,9 @@ def _get_state(pin):
             'blink_start': 0,
             'blink_duration': 0,
             'blink_interval': 500,
-            'pin_obj': None
+            'pin_obj': None,
+            'output': None,
+            'done': None
         }
     return states[pin]
 
@@ -55,16 +78,28 @@ def init(config):
     state['pin_obj'].value(0)
     state['current_state'] = 0
     
+    def output(level):
+        state['pin_obj'].value(level)
+        state['current_state'] = level
+    
+    def done():
+        output(0)
+        state['blink_active'] = False
+        print(f"Blink completed for pin {pin}")
+    
+    state['output'] = output
+    state['done'] = done
+    
     print(f"LED Driver initialized for pin {pin}")
 
 def on(config):
     """Turn LED on"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    _stop_pattern(pin, state)
     
     state['pin_obj'].value(1)
     state['current_state'] = 1
-    state['blink_active'] = False
     
     print(f"LED on pin {pin} turned ON")
 
@@ -72,15 +107,16 @@ def off(config):
     """Turn LED off"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    _stop_pattern(pin, state)
     
     state['pin_obj'].value(0)
     state['current_state'] = 0
-    state['blink_active'] = False
     
 def toggle(config):
     """Toggle LED state"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    _stop_pattern(pin, state)
     
     if state['current_state'] == 1:
         state['pin_obj'].value(0)
@@ -91,8 +127,19 @@ def toggle(config):
     
     state['last_toggle'] = time.ticks_ms()
     state['toggle_count'] += 1
+
+def _stop_pattern(pin, state):
+    """Stop a running blink or pattern"""
+    player.stop(pin)
     state['blink_active'] = False
 
+def _play(pin, state, steps, repeat=0, duration=0):
+    """Play steps on the LED from the pattern timer"""
+    state['blink_active'] = True
+    state['blink_start'] = time.ticks_ms()
+    state['blink_duration'] = duration
+    player.play(pin, Pattern(state['output'], steps, repeat, duration, state['done']))
+
 def blink(config):
     """Start blinking LED"""
     pin = config['pins'][0]
@@ -102,13 +149,39 @@ def blink(config):
     duration = int(data.get('duration', 5000))
     interval = int(data.get('interval', 500))
     
-    state['blink_active'] = True
-    state['blink_start'] = time.ticks_ms()
-    state['blink_duration'] = duration
+    if duration <= 0:
+        # Over before it starts, a pattern with no duration would run forever
+        _stop_pattern(pin, state)
+        state['done']()
+        return
+    if interval <= 0:
+        print(f"LED on pin {pin}: blink interval must be positive")
+        return
+    
     state['blink_interval'] = interval
+    _play(pin, state, (1, interval, 0, interval), duration=duration)
     
     print(f"LED on pin {pin} starting blink for {duration}ms with {interval}ms interval")
 
+def pattern(config):
+    """Play a named pattern or 'level:ms,...' steps"""
+    pin = config['pins'][0]
+    state = _get_state(pin)
+    data = config.get('data', {})
+    
+    if 'steps' in data:
+        steps = parse_steps(data['steps'])
+    else:
+        steps = PATTERNS.get(data.get('name', 'heartbeat'))
+    if not steps:
+        print(f"LED on pin {pin}: unknown pattern")
+        return
+    
+    repeat = int(data.get('repeat', 0))
+    _play(pin, state, steps, repeat)
+    
+    print(f"LED on pin {pin} playing pattern")
+
 def get_states(config):
     """Get LED states"""
     pin = config['pins'][0]
@@ -119,27 +192,3 @@ def get_states(config):
         'blink_active': state['blink_active'],
         'toggle_count': state['toggle_count']
     }
-
-def update(config):
-    """Update LED (handle blinking)"""
-    pin = config['pins'][0]
-    state = _get_state(pin)
-    now = time.ticks_ms()
-    
-    if state['blink_active']:
-        if time.ticks_diff(now, state['blink_start']) > state['blink_duration']:
-            state['blink_active'] = False
-            state['pin_obj'].value(0)
-            state['current_state'] = 0
-            print(f"Blink completed for pin {pin}")
-            return
-        
-        blink_cycle = time.ticks_diff(now, state['blink_start']) % (state['blink_interval'] * 2)
-        should_be_on = blink_cycle < state['blink_interval']
-        
-        if should_be_on and state['current_state'] == 0:
-            state['pin_obj'].value(1)
-            state['current_state'] = 1
-        elif not should_be_on and state['current_state'] == 1:
-            state['pin_obj'].value(0)
-            state['current_state'] = 0
\ No newline at end of file
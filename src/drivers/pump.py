@@ -1,16 +1,20 @@
 from machine import Pin
 import time
 
+from scheduler import scheduler
+
 # Driver metadata
 METADATA = {
     'methods': {
         'on': {
             'description': 'Turn pump on',
-            'params': []
+            'params': [],
+            'target': {'state': 'ON'}
         },
         'off': {
             'description': 'Turn pump off',
-            'params': []
+            'params': [],
+            'target': {'state': 'OFF'}
         },
         'toggle': {
             'description': 'Toggle pump state',
@@ -36,6 +40,7 @@ def _get_state(pin):
             'active': False,
             'start_time': 0,
             'total_run_time': 0,
+            'off_timer': None,
             'pin_obj': None
         }
     return states[pin]
@@ -52,10 +57,16 @@ def init(config):
     
     print(f"Pump Driver initialized for pin {pin}")
 
+def _cancel_timer(state):
+    """Cancel a pending run_duration stop"""
+    scheduler.cancel(state['off_timer'])
+    state['off_timer'] = None
+
 def on(config):
     """Turn pump on"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    _cancel_timer(state)
     
     if not state['active']:
         state['pin_obj'].value(1)
@@ -67,6 +78,7 @@ def off(config):
     """Turn pump off"""
     pin = config['pins'][0]
     state = _get_state(pin)
+    _cancel_timer(state)
     
     if state['active']:
         state['pin_obj'].value(0)
@@ -96,8 +108,12 @@ def run_duration(config):
     duration = int(data.get('duration', 1000))
     
     on(config)
-    time.sleep_ms(duration)
-    off(config)
+    _get_state(pin)['off_timer'] = scheduler.call_later(duration, _finish_run, (pin, duration))
+
+def _finish_run(run):
+    """Stop a run_duration run"""
+    pin, duration = run
+    off({'pins': [pin]})
     
     print(f"Pump on pin {pin} ran for {duration}ms")
 
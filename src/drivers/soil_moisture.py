@@ -1,4 +1,5 @@
 from machine import Pin, ADC
+from array import array
 import time
 
 # Driver metadata
@@ -31,6 +32,15 @@ METADATA = {
     ]
 }
 
+# Background sampling, one ADC sample per interval from update()
+SAMPLE_INTERVAL_MS = 50
+# Median of the last samples rejects ADC spikes (1 disables it)
+MEDIAN_WINDOW = 5
+# EMA weight of a new median is 1 / 2**EMA_SHIFT
+EMA_SHIFT = 3
+# Fixed-point fraction bits of the EMA
+EMA_FRACTION = 4
+
 # State storage
 sensors = {}
 
@@ -43,7 +53,12 @@ def _get_sensor(pin):
     if pin not in sensors:
         sensors[pin] = {
             'adc': None,
-            'readings': []
+            'window': array('H', [0] * MEDIAN_WINDOW),
+            'scratch': array('H', [0] * MEDIAN_WINDOW),
+            'index': 0,
+            'count': 0,
+            'ema': 0,
+            'last_sample': 0
         }
     return sensors[pin]
 
@@ -62,6 +77,50 @@ def init(config):
     except Exception as e:
         print(f"Soil Moisture initialization error on pin {pin}: {e}")
 
+def _median(sensor):
+    """Median of the sampled window, sorted in the preallocated scratch array"""
+    window = sensor['window']
+    scratch = sensor['scratch']
+    count = sensor['count']
+    
+    for i in range(count):
+        value = window[i]
+        j = i
+        while j and scratch[j - 1] > value:
+            scratch[j] = scratch[j - 1]
+            j -= 1
+        scratch[j] = value
+    return scratch[count // 2]
+
+def _sample(sensor):
+    """Take one ADC sample and fold it into the filter"""
+    index = sensor['index']
+    sensor['window'][index] = sensor['adc'].read()
+    sensor['index'] = (index + 1) % MEDIAN_WINDOW
+    if sensor['count'] < MEDIAN_WINDOW:
+        sensor['count'] += 1
+    
+    median = _median(sensor) << EMA_FRACTION
+    if sensor['count'] == 1:
+        sensor['ema'] = median
+    else:
+        sensor['ema'] += (median - sensor['ema']) >> EMA_SHIFT
+    sensor['last_sample'] = time.ticks_ms()
+
+def update(config):
+    """Sample in the background so read() does not block"""
+    pin = config['pins'][0]
+    sensor = _get_sensor(pin)
+    
+    if not sensor['adc']:
+        return
+    
+    if time.ticks_diff(time.ticks_ms(), sensor['last_sample']) >= SAMPLE_INTERVAL_MS:
+        try:
+            _sample(sensor)
+        except Exception as e:
+            print(f"Soil Moisture sample error on pin {pin}: {e}")
+
 def read(config):
     """Read soil moisture sensor"""
     pin = config['pins'][0]
@@ -76,13 +135,11 @@ def read(config):
         }
     
     try:
-        # Read multiple samples and average
-        samples = []
-        for _ in range(5):
-            samples.append(sensor['adc'].read())
-            time.sleep_ms(10)
+        if sensor['count'] == 0:
+            # Nothing sampled yet
+            _sample(sensor)
         
-        raw_value = sum(samples) // len(samples)
+        raw_value = (sensor['ema'] + (1 << (EMA_FRACTION - 1))) >> EMA_FRACTION
         
         # Scale to 0-1023 range (like Arduino)
         scaled_value = int((raw_value / 4095) * 1023)
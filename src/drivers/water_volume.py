@@ -1,4 +1,5 @@
-from machine import Pin, time_pulse_us
+from machine import Pin
+from array import array
 import time
 
 # Driver metadata
@@ -39,6 +40,20 @@ TANK_HEIGHT_CM = 30.0       # Height from sensor to bottom
 TANK_AREA_CM2 = 500.0       # Cross-sectional area of tank
 TANK_CAPACITY_L = 15.0      # Maximum capacity in liters
 
+# Background pinging, at most one echo in flight
+PING_INTERVAL_MS = 100
+ECHO_TIMEOUT_MS = 30
+# Median of the last valid echoes rejects outliers
+MEDIAN_SAMPLES = 5
+
+# Valid range 2-400cm as echo times (speed of sound = 343 m/s)
+SOUND_CM_PER_US = 0.0343
+MIN_ECHO_US = int(2.0 * 2 / SOUND_CM_PER_US)
+MAX_ECHO_US = int(400.0 * 2 / SOUND_CM_PER_US)
+
+# Echo capture slots written by the interrupt handler
+RISE, FALL, EDGE_STATE = 0, 1, 2
+
 def _get_sensor(pins):
     """Get or create sensor for pins"""
     key = f"{pins[0]}_{pins[1]}"
@@ -46,7 +61,14 @@ def _get_sensor(pins):
         sensors[key] = {
             'trigger': None,
             'echo': None,
-            'readings': []
+            'edges': array('L', [0, 0, 0]),
+            'pending': False,
+            'ping_time': 0,
+            'samples': array('H', [0] * MEDIAN_SAMPLES),
+            'scratch': array('H', [0] * MEDIAN_SAMPLES),
+            'index': 0,
+            'count': 0,
+            'misses': 0
         }
     return sensors[key]
 
@@ -62,35 +84,84 @@ def init(config):
         sensor['trigger'] = Pin(trigger_pin, Pin.OUT)
         sensor['echo'] = Pin(echo_pin, Pin.IN)
         sensor['trigger'].value(0)
-        time.sleep_ms(100)
-        print(f"Water Volume Driver initialized")
-    except Exception as e:
-        print(f"Water Volume initialization error: {e}")
-
-def _measure_distance(trigger, echo):
-    """Measure distance using ultrasonic sensor"""
-    try:
-        # Send trigger pulse
-        trigger.value(0)
-        time.sleep_us(2)
-        trigger.value(1)
-        time.sleep_us(10)
-        trigger.value(0)
-        
-        # Measure echo pulse duration
-        duration = time_pulse_us(echo, 1, 30000)  # 30ms timeout
-        
-        if duration < 0:
-            return None
+        sensor['ping_time'] = time.ticks_ms()
         
-        # Calculate distance in cm (speed of sound = 343 m/s)
-        distance = (duration * 0.0343) / 2
+        edges = sensor['edges']
         
-        return distance
+        def on_echo(pin):
+            # Timestamp both edges of the echo pulse
+            if pin.value():
+                edges[RISE] = time.ticks_us()
+                edges[EDGE_STATE] = 1
+            elif edges[EDGE_STATE] == 1:
+                edges[FALL] = time.ticks_us()
+                edges[EDGE_STATE] = 2
         
+        sensor['echo'].irq(handler=on_echo, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+        print(f"Water Volume Driver initialized")
     except Exception as e:
-        print(f"Distance measurement error: {e}")
-        return None
+        print(f"Water Volume initialization error: {e}")
+
+def _ping(sensor):
+    """Send a trigger pulse, the echo is timed by the interrupt handler"""
+    sensor['edges'][EDGE_STATE] = 0
+    trigger = sensor['trigger']
+    trigger.value(1)
+    time.sleep_us(10)
+    trigger.value(0)
+    sensor['pending'] = True
+    sensor['ping_time'] = time.ticks_ms()
+
+def _add_sample(sensor, echo_us):
+    """Store a valid echo time in the sample ring"""
+    if not MIN_ECHO_US <= echo_us <= MAX_ECHO_US:
+        sensor['misses'] += 1
+        return
+    
+    index = sensor['index']
+    sensor['samples'][index] = echo_us
+    sensor['index'] = (index + 1) % MEDIAN_SAMPLES
+    if sensor['count'] < MEDIAN_SAMPLES:
+        sensor['count'] += 1
+    sensor['misses'] = 0
+
+def _median(sensor):
+    """Median echo time, sorted in the preallocated scratch array"""
+    samples = sensor['samples']
+    scratch = sensor['scratch']
+    count = sensor['count']
+    
+    for i in range(count):
+        value = samples[i]
+        j = i
+        while j and scratch[j - 1] > value:
+            scratch[j] = scratch[j - 1]
+            j -= 1
+        scratch[j] = value
+    return scratch[count // 2]
+
+def update(config):
+    """Collect the last echo and send the next ping"""
+    sensor = _get_sensor(config['pins'])
+    
+    if not sensor['trigger'] or not sensor['echo']:
+        return
+    
+    now = time.ticks_ms()
+    edges = sensor['edges']
+    
+    if sensor['pending']:
+        if edges[EDGE_STATE] == 2:
+            sensor['pending'] = False
+            _add_sample(sensor, time.ticks_diff(edges[FALL], edges[RISE]))
+        elif time.ticks_diff(now, sensor['ping_time']) > ECHO_TIMEOUT_MS:
+            sensor['pending'] = False
+            sensor['misses'] += 1
+        else:
+            return
+    
+    if time.ticks_diff(now, sensor['ping_time']) >= PING_INTERVAL_MS:
+        _ping(sensor)
 
 def read(config):
     """Read water level and calculate volume"""
@@ -106,25 +177,16 @@ def read(config):
         }
     
     try:
-        # Take multiple readings and average
-        distances = []
-        for _ in range(3):
-            dist = _measure_distance(sensor['trigger'], sensor['echo'])
-            if dist is not None and 2.0 <= dist <= 400.0:  # Valid range
-                distances.append(dist)
-            time.sleep_ms(100)
-        
-        if not distances:
+        if sensor['count'] == 0 or sensor['misses'] >= MEDIAN_SAMPLES:
             return {
                 'distance_cm': 0.0,
                 'water_level_cm': 0.0,
                 'volume_liters': 0.0,
                 'percent_full': 0.0,
-                'status': 'no_reading'
+                'status': 'pending' if sensor['misses'] < MEDIAN_SAMPLES else 'no_reading'
             }
         
-        # Average distance
-        distance_cm = sum(distances) / len(distances)
+        distance_cm = _median(sensor) * SOUND_CM_PER_US / 2
         
         # Calculate water level from bottom
         water_level_cm = max(0, TANK_HEIGHT_CM - distance_cm)
@@ -0,0 +1,115 @@
+import json
+import time
+import _thread
+
+import config
+
+SSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: keep-alive\r\n\r\n"
+)
+KEEPALIVE = b": keepalive\n\n"
+
+class Subscriber:
+    def __init__(self, conn, interval_ms):
+        self.conn = conn
+        self.interval_ms = interval_ms
+        self.last_sent = time.ticks_ms()
+        self.sequence = 0
+
+class EventHub:
+    """Pushes sensor readings and actuator states to SSE subscribers"""
+    def __init__(self):
+        self.subscribers = []
+        self.latest = {}
+        self.sequence = 0
+        self.lock = _thread.allocate_lock()
+
+    def subscribe(self, conn, interval_ms=None):
+        """Take over an open connection, returns False when full"""
+        if len(self.subscribers) >= config.SSE_MAX_SUBSCRIBERS:
+            return False
+
+        if interval_ms is None:
+            interval_ms = config.SSE_DEFAULT_INTERVAL
+        interval_ms = max(interval_ms, config.SSE_MIN_INTERVAL)
+
+        with self.lock:
+            self.subscribers.append(Subscriber(conn, interval_ms))
+        print(f'SSE subscriber added ({len(self.subscribers)} active)')
+        return True
+
+    def publish(self, kind, name, data):
+        """Record the latest event for a device, sent on the next flush"""
+        if not self.subscribers:
+            return
+
+        payload = json.dumps({'name': name, 'data': data})
+        event = b'event: ' + kind.encode() + b'\ndata: ' + payload.encode() + b'\n\n'
+        with self.lock:
+            self.sequence += 1
+            self.latest[name] = (self.sequence, event)
+
+    def flush(self):
+        """Send pending events to every subscriber whose interval has passed"""
+        if not self.subscribers:
+            return
+
+        now = time.ticks_ms()
+        for subscriber in self.subscribers[:]:
+            elapsed = time.ticks_diff(now, subscriber.last_sent)
+            if elapsed < subscriber.interval_ms:
+                continue
+
+            with self.lock:
+                chunks = [event for sequence, event in self.latest.values()
+                          if sequence > subscriber.sequence]
+                sequence = self.sequence
+            if not chunks:
+                if elapsed < config.SSE_KEEPALIVE_INTERVAL:
+                    continue
+                chunks.append(KEEPALIVE)
+
+            if self._send(subscriber, b''.join(chunks)):
+                subscriber.sequence = sequence
+                subscriber.last_sent = now
+
+    def _send(self, subscriber, data):
+        conn = subscriber.conn
+        try:
+            # Queued connections count what is still unsent from earlier flushes,
+            # a single large flush is fine
+            backlog = conn.backlog() if hasattr(conn, 'backlog') else 0
+            if backlog <= config.SSE_MAX_BACKLOG:
+                sent = conn.send(data)
+                if sent is not None and sent == len(data):
+                    return True
+        except OSError:
+            pass
+
+        # Slow or gone, a partial event cannot be resumed
+        self.drop(subscriber)
+        return False
+
+    def disconnect(self, conn):
+        """Drop the subscriber for a connection closed by the client"""
+        for subscriber in self.subscribers[:]:
+            if subscriber.conn is conn:
+                self.drop(subscriber)
+
+    def drop(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            if not self.subscribers:
+                self.latest = {}
+        try:
+            subscriber.conn.close()
+        except Exception:
+            pass
+        print(f'SSE subscriber dropped ({len(self.subscribers)} active)')
+
+event_hub = EventHub()
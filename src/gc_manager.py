@@ -0,0 +1,83 @@
+import gc
+import time
+
+import config
+import metrics
+
+class GCManager:
+    """Collects when enough has been allocated, preferably while idle"""
+    def __init__(self):
+        self.threshold = 0
+        self.alloc_after = 0
+        self.high_water = 0
+        self.collections = 0
+        self.last_collect = time.ticks_ms()
+        self.last_activity = self.last_collect
+        self.last_pause_us = 0
+        self.max_pause_us = 0
+        self.total_pause_us = 0
+
+    def setup(self):
+        """Hand allocation-volume collections to the VM and start from a clean heap"""
+        heap = gc.mem_free() + gc.mem_alloc()
+        self.threshold = heap * config.GC_THRESHOLD_PERCENT // 100
+        gc.threshold(self.threshold)
+        self.collect()
+
+    def activity(self):
+        """Mark the system busy, e.g. a request was just served"""
+        self.last_activity = time.ticks_ms()
+
+    def collect(self):
+        start = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start)
+        metrics.gc_pause.observe(pause)
+
+        self.collections += 1
+        self.last_collect = time.ticks_ms()
+        self.last_pause_us = pause
+        self.total_pause_us += pause
+        if pause > self.max_pause_us:
+            self.max_pause_us = pause
+        self.alloc_after = gc.mem_alloc()
+
+    def poll(self):
+        """Called periodically; collects early when the heap is tight or the system is idle"""
+        allocated = gc.mem_alloc()
+        if allocated > self.high_water:
+            self.high_water = allocated
+
+        grown = allocated - self.alloc_after
+        if grown <= 0:
+            # The VM collected on its own since the last poll
+            self.alloc_after = allocated
+            return
+
+        if gc.mem_free() < config.GC_MIN_FREE:
+            self.collect()
+            return
+
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_activity) < config.GC_IDLE_MS:
+            return
+
+        # Do the work the VM would do later anyway while nobody is waiting,
+        # but skip it when there is little garbage to reclaim
+        if (grown >= self.threshold // 4
+                or time.ticks_diff(now, self.last_collect) >= config.GC_INTERVAL):
+            self.collect()
+
+    def stats(self):
+        return {
+            'collections': self.collections,
+            'threshold': self.threshold,
+            'high_water': self.high_water,
+            'last_pause_us': self.last_pause_us,
+            'max_pause_us': self.max_pause_us,
+            'avg_pause_us': self.total_pause_us // self.collections if self.collections else 0
+        }
+
+gc_manager = GCManager()
+
+metrics.Gauge('chlorofill_heap_high_water_bytes', 'Highest allocated heap seen', lambda: gc_manager.high_water)
@@ -0,0 +1,148 @@
+import json
+import time
+from array import array
+
+import config
+
+RESOLUTIONS = ('raw', '1m', '1h')
+MINUTE_MS = 60000
+MINUTES_PER_HOUR = 60
+
+# Readings with these statuses carry placeholder values
+SKIP_STATUSES = ('error', 'no_sensor', 'no_reading', 'pending')
+
+class Ring:
+    """Fixed-size circular buffer of samples"""
+    def __init__(self, typecode, depth):
+        self.values = array(typecode, (0 for _ in range(depth)))
+        self.depth = depth
+        self.head = 0
+        self.count = 0
+        self.updated = 0
+
+    def push(self, value, now):
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.depth
+        if self.count < self.depth:
+            self.count += 1
+        self.updated = now
+
+    def __iter__(self):
+        """Oldest to newest"""
+        start = (self.head - self.count) % self.depth
+        for i in range(self.count):
+            yield self.values[(start + i) % self.depth]
+
+class Series:
+    """Raw samples of one sensor field plus 1-minute and 1-hour averages"""
+    def __init__(self, field, typecode, depth):
+        self.field = field
+        self.integer = typecode == 'H'
+        self.rings = {
+            'raw': Ring(typecode, depth),
+            '1m': Ring('f', config.HISTORY_MINUTE_DEPTH),
+            '1h': Ring('f', config.HISTORY_HOUR_DEPTH)
+        }
+        self.intervals = {
+            'raw': config.HISTORY_INTERVAL,
+            '1m': MINUTE_MS,
+            '1h': MINUTE_MS * MINUTES_PER_HOUR
+        }
+        self.minute_start = time.ticks_ms()
+        self.minute_sum = 0.0
+        self.minute_count = 0
+        self.hour_sum = 0.0
+        self.hour_count = 0
+
+    def record(self, value, now):
+        if self.integer:
+            value = min(max(int(value), 0), 0xFFFF)
+        self.rings['raw'].push(value, now)
+        self.minute_sum += value
+        self.minute_count += 1
+
+        elapsed = time.ticks_diff(now, self.minute_start)
+        if elapsed < MINUTE_MS:
+            return
+        # Stay aligned to whole minutes unless recording stalled
+        if elapsed < 2 * MINUTE_MS:
+            self.minute_start = time.ticks_add(self.minute_start, MINUTE_MS)
+        else:
+            self.minute_start = now
+
+        average = self.minute_sum / self.minute_count
+        self.rings['1m'].push(average, now)
+        self.minute_sum = 0.0
+        self.minute_count = 0
+
+        self.hour_sum += average
+        self.hour_count += 1
+        if self.hour_count >= MINUTES_PER_HOUR:
+            self.rings['1h'].push(self.hour_sum / self.hour_count, now)
+            self.hour_sum = 0.0
+            self.hour_count = 0
+
+class SensorHistory:
+    """In-RAM history for every numeric sensor field"""
+    def __init__(self):
+        self.sensors = {}
+        self.pending = []
+
+    def build(self, device_manager):
+        # Drivers load on first use, so series are added once a sensor has read
+        self.sensors = {}
+        self.pending = list(device_manager.sensor_contexts)
+
+    def _add(self, ctx):
+        meta = getattr(ctx.driver, 'METADATA', {})
+        depth = config.HISTORY_DEPTH
+        series = []
+        for reading in meta.get('readings', []):
+            if reading['type'] == 'float':
+                series.append(Series(reading['name'], 'f', depth))
+            elif reading['type'] == 'int':
+                series.append(Series(reading['name'], 'H', depth))
+        if series:
+            self.sensors[ctx.name] = (ctx, series)
+
+    def record(self):
+        now = time.ticks_ms()
+        pending = self.pending
+        for ctx in pending[:]:
+            if ctx.reading is not None:
+                pending.remove(ctx)
+                self._add(ctx)
+        for ctx, series in self.sensors.values():
+            reading = ctx.reading
+            if reading is None or reading.get('status') in SKIP_STATUSES:
+                continue
+            for s in series:
+                value = reading.get(s.field)
+                if value is not None:
+                    s.record(value, now)
+
+    def find(self, name, field):
+        entry = self.sensors.get(name)
+        if entry is None:
+            return None
+        for s in entry[1]:
+            if s.field == field:
+                return s
+        return None
+
+    def write_json(self, out, name, series, resolution):
+        """Write one resolution of a series as JSON, value by value"""
+        ring = series.rings[resolution]
+        age = time.ticks_diff(time.ticks_ms(), ring.updated) if ring.count else -1
+        out.write('{"name": %s, "field": %s, "res": "%s", "interval_ms": %d, "age_ms": %d, "values": ['
+                  % (json.dumps(name), json.dumps(series.field), resolution,
+                     series.intervals[resolution], age))
+        first = True
+        for value in ring:
+            if not first:
+                out.write(', ')
+            out.write(str(value) if series.integer and resolution == 'raw' else '%.2f' % value)
+            first = False
+        out.write(']}')
+
+sensor_history = SensorHistory()
@@ -0,0 +1,275 @@
+import io
+import json
+
+import config
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+def url_decode(value, plus=True):
+    """Decode %XX escapes, and '+' when plus is set (query components only)"""
+    if '%' not in value and not (plus and '+' in value):
+        return value
+    
+    if plus:
+        value = value.replace('+', ' ')
+    parts = value.split('%')
+    out = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            if len(part) < 2:
+                raise ValueError
+            out.append(int(part[:2], 16))
+            out.extend(part[2:].encode())
+        except ValueError:
+            out.extend(b'%')
+            out.extend(part.encode())
+    try:
+        return bytes(out).decode()
+    except UnicodeError:
+        raise HTTPError(400, "Invalid URL encoding")
+
+def parse_query(query_string):
+    query = {}
+    for pair in query_string.split('&'):
+        if not pair:
+            continue
+        key, _, value = pair.partition('=')
+        query[url_decode(key)] = url_decode(value)
+    return query
+
+def _decode(data):
+    try:
+        return bytes(data).decode()
+    except UnicodeError:
+        raise HTTPError(400, "Invalid request encoding")
+
+# Only these headers are decoded, the rest are skipped in place
+HEADERS = ('content-length', 'if-none-match')
+
+class RequestReader:
+    """Incremental request parser over a preallocated buffer"""
+    def __init__(self, size=None):
+        self.buf = bytearray(size or config.HTTP_BUFFER_SIZE)
+        self.mv = memoryview(self.buf)
+        self.reset()
+    
+    def reset(self):
+        self.length = 0
+        self.line_start = 0
+        self.request_line = None
+        self.headers = {}
+        self.header_end = -1
+        self.content_length = 0
+    
+    def free(self):
+        """Unfilled part of the buffer to receive into"""
+        if self.length >= len(self.buf):
+            raise HTTPError(413, "Request too large")
+        return self.mv[self.length:]
+    
+    def feed(self, count):
+        """Account for count received bytes, returns a Request once complete"""
+        if count == 0:
+            raise HTTPError(400, "Incomplete request")
+        
+        start = self.length
+        self.length += count
+        
+        if self.header_end < 0:
+            self._parse_headers(start)
+            if self.header_end < 0:
+                return None
+        
+        end = self.header_end + self.content_length
+        if self.length < end:
+            return None
+        return self._build_request(end)
+    
+    def _parse_headers(self, start):
+        buf = self.buf
+        for i in range(start, self.length):
+            if buf[i] != 10:  # '\n'
+                continue
+            
+            line_end = i - 1 if i > self.line_start and buf[i - 1] == 13 else i
+            if line_end == self.line_start:
+                self._end_headers(i + 1)
+                return
+            self._parse_line(self.line_start, line_end)
+            self.line_start = i + 1
+    
+    def _parse_line(self, start, end):
+        if self.request_line is None:
+            self.request_line = _decode(self.mv[start:end])
+            return
+        
+        # Cheap first-letter filter before decoding a header line
+        first = self.buf[start] | 0x20
+        if first != 99 and first != 105:  # 'c', 'i'
+            return
+        
+        name, sep, value = _decode(self.mv[start:end]).partition(':')
+        name = name.strip().lower()
+        if sep and name in HEADERS:
+            self.headers[name] = value.strip()
+    
+    def _end_headers(self, header_end):
+        if self.request_line is None:
+            raise HTTPError(400, "Missing request line")
+        
+        try:
+            self.content_length = int(self.headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        
+        if self.content_length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if header_end + self.content_length > len(self.buf):
+            raise HTTPError(413, "Request too large")
+        self.header_end = header_end
+    
+    def _build_request(self, end):
+        parts = (self.request_line or "").split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+        
+        path, _, query_string = target.partition('?')
+        query = parse_query(query_string) if query_string else {}
+        
+        body = None
+        if self.content_length and method in ("POST", "PUT"):
+            try:
+                body = json.loads(bytes(self.mv[self.header_end:end]))
+            except ValueError:
+                raise HTTPError(400, "Invalid JSON body")
+        
+        return Request(method, url_decode(path, False), query, self.headers, body)
+
+STATUS_LINES = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    204: b"HTTP/1.1 204 No Content\r\n",
+    304: b"HTTP/1.1 304 Not Modified\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    413: b"HTTP/1.1 413 Payload Too Large\r\n",
+    500: b"HTTP/1.1 500 Internal Server Error\r\n",
+    503: b"HTTP/1.1 503 Service Unavailable\r\n",
+}
+
+JSON_HEADERS = (
+    b"Content-Type: application/json\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: GET, POST, PUT, DELETE, OPTIONS\r\n"
+    b"Access-Control-Allow-Headers: Content-Type\r\n"
+    b"Connection: close\r\n"
+)
+
+BINARY_HEADERS = (
+    b"Content-Type: application/octet-stream\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n"
+)
+
+# Room left in front of the body for the status line and headers
+HEADER_SPACE = 320
+# Stream length for bodies whose size is not known up front
+UNKNOWN_LENGTH = -1
+
+class ResponseBuffer(io.IOBase):
+    """Reusable response buffer that json.dump can write into"""
+    # MicroPython's json.dump needs the stream protocol, hence IOBase
+    def __init__(self, size=None):
+        self.base = bytearray(size or config.HTTP_RESPONSE_BUFFER_SIZE)
+        self.buf = self.base
+        self.mv = memoryview(self.buf)
+        self.pos = HEADER_SPACE
+    
+    def reset(self):
+        self.pos = HEADER_SPACE
+    
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        end = self.pos + len(data)
+        if end > len(self.buf):
+            self._grow(end)
+        self.mv[self.pos:end] = data
+        self.pos = end
+        return len(data)
+    
+    def _grow(self, needed):
+        buf = bytearray(max(needed, len(self.buf) * 2))
+        buf[:self.pos] = self.mv[:self.pos]
+        self.buf = buf
+        self.mv = memoryview(buf)
+    
+    def send(self, conn, status_code, headers=JSON_HEADERS, extra_headers=b"", length=None):
+        """Prepend the headers in place and send everything in one go"""
+        if length is None:
+            length = self.pos - HEADER_SPACE
+        status = STATUS_LINES.get(status_code) or STATUS_LINES[500]
+        if length == UNKNOWN_LENGTH:
+            # Connection: close delimits the body
+            parts = (status, headers, extra_headers, b"\r\n")
+        else:
+            parts = (status, headers, extra_headers,
+                     b"Content-Length: ", str(length).encode(), b"\r\n\r\n")
+        
+        start = HEADER_SPACE
+        for part in parts:
+            start -= len(part)
+        if start < 0:
+            raise ValueError("Headers too large")
+        
+        pos = start
+        for part in parts:
+            self.mv[pos:pos + len(part)] = part
+            pos += len(part)
+        
+        try:
+            send_all(conn, self.mv[start:self.pos])
+        finally:
+            if self.buf is not self.base:
+                # Let an oversized payload's buffer go instead of pinning it
+                self.buf = self.base
+                self.mv = memoryview(self.base)
+
+response = ResponseBuffer()
+
+def send_all(conn, data):
+    while data:
+        sent = conn.send(data)
+        if sent is None:
+            raise OSError("Connection stalled")
+        data = data[sent:]
+
+def send_buffered(conn, status_code=200):
+    """Send whatever was written into the response buffer since reset()"""
+    response.send(conn, status_code)
+
+def send_stream_headers(conn, length, headers=BINARY_HEADERS, extra_headers=b""):
+    """Send headers for a body that the caller streams afterwards,
+    length may be UNKNOWN_LENGTH"""
+    response.reset()
+    response.send(conn, 200, headers, extra_headers, length)
+
+def send_response(conn, data, status_code=200, extra_headers=b""):
+    response.reset()
+    if isinstance(data, (str, bytes)):
+        response.write(data)
+    elif data is not None:
+        json.dump(data, response)
+    response.send(conn, status_code, JSON_HEADERS, extra_headers)
@@ -1,15 +1,24 @@
 import gc
 import time
-import json
 import network
-import socket
 
 import config
+import metrics
+import wallclock
+from boot_report import report as boot_report
+from datalog import datalogger
 from device_manager import DeviceManager
+from events import SSE_HEADERS, event_hub
+from gc_manager import gc_manager
+from history import RESOLUTIONS, sensor_history
+from http_server import (JSON_HEADERS, UNKNOWN_LENGTH, response, send_all, send_buffered,
+                         send_response, send_stream_headers)
+from scheduler import scheduler
 from unit_manager import UnitManager
 
 unit_manager = UnitManager(config.UNIT_ID, config.UNIT_MODEL, config.FW_VERSION)
 device_manager = DeviceManager()
+device_manager.listeners.append(event_hub.publish)
 
 def setup_wifi():
     ap = network.WLAN(network.AP_IF)
@@ -27,18 +36,45 @@ def setup_wifi():
         print(f'AP Name         : {ap_name}')
         print(f'AP Password     : {config.WIFI_AP_PASSWORD}')
 
-def send_response(conn, data, status_code=200):
-    if isinstance(data, dict):
-        data = json.dumps(data)
-    response = f"HTTP/1.1 {status_code} OK\r\n"
-    response += "Content-Type: application/json\r\n"
-    response += "Access-Control-Allow-Origin: *\r\n"
-    response += "Access-Control-Allow-Methods: GET, POST, PUT, DELETE, OPTIONS\r\n"
-    response += "Access-Control-Allow-Headers: Content-Type\r\n\r\n"
-    response += data
-    conn.send(response)
-
-def handle_request(conn, path, method, query_params, body):
+SUCCESS_BODY = b"<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>"
+SUCCESS_PAGE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/html\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: " + str(len(SUCCESS_BODY)).encode() + b"\r\n\r\n" + SUCCESS_BODY
+)
+
+def send_cached(conn, request, key):
+    payload = device_manager.get_payload(key)
+    if payload is None:
+        send_response(conn, {"error": "Not found"}, 404)
+        return
+    body, etag = payload
+    extra_headers = b"ETag: " + etag.encode() + b"\r\nCache-Control: no-cache\r\n"
+    if request.headers.get("if-none-match") == etag:
+        send_response(conn, None, 304, extra_headers)
+        return
+    send_stream_headers(conn, len(body), JSON_HEADERS, extra_headers)
+    send_all(conn, body)
+
+# Paths handle_request serves, each gets its own latency histogram
+ROUTES = (
+    "/generate_204", "/gen_204", "/library/test/success.html",
+    "/hotspot-detect.html", "/success.html",
+    "/system/boot", "/system/time", "/system/metrics", "/system/info",
+    "/actuators", "/actuators/states", "/actuator", "/actuator/control",
+    "/sensors", "/sensors/all", "/sensor", "/sensor/history", "/events",
+    "/log/schema", "/log/export",
+    "/automations", "/automation/toggle", "/automation/trigger", "/metadata",
+)
+metrics.track_routes(ROUTES)
+
+def handle_request(conn, request):
+    path = request.path
+    method = request.method
+    query_params = request.query
+    body = request.body
+
     if path in (
         "/generate_204",
         "/gen_204",
@@ -48,23 +84,46 @@ def handle_request(conn, path, method, query_params, body):
         return
 
     if path in ("/hotspot-detect.html", "/success.html"):
-        conn.send("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n"
-                  "<HTML><HEAD><TITLE>Success</TITLE></HEAD>"
-                  "<BODY>Success</BODY></HTML>")
+        send_all(conn, SUCCESS_PAGE)
         return
 
-    if path == "/system/info":
+    if path == "/system/boot" and method == "GET":
+        send_response(conn, boot_report.to_dict())
+
+    elif path == "/system/time":
+        if method == "POST":
+            timestamp = body.get("timestamp") if body else None
+            if timestamp is None:
+                send_response(conn, {"error": "Missing timestamp"}, 400)
+                return
+            try:
+                wallclock.set_time(timestamp, body.get("utc_offset", 0))
+            except (TypeError, ValueError):
+                send_response(conn, {"error": "Invalid timestamp"}, 400)
+                return
+        send_response(conn, wallclock.to_dict())
+
+    elif path == "/system/metrics" and method == "GET":
+        # Streamed a series at a time rather than built in one buffer
+        send_stream_headers(conn, UNKNOWN_LENGTH, metrics.TEXT_HEADERS)
+        return metrics.render()
+
+    elif path == "/system/info":
         info = {
             'unit_id': config.UNIT_ID,
             'model': config.UNIT_MODEL,
             'firmware': config.FW_VERSION,
             'free_heap': gc.mem_free(),
+            'gc': gc_manager.stats(),
             'uptime': time.ticks_ms()
         }
         send_response(conn, info)
 
     elif path == "/actuators" and method == "GET":
-        send_response(conn, device_manager.get_actuator_names())
+        send_cached(conn, request, "actuators")
+
+    elif path == "/actuators/states" and method == "GET":
+        send_response(conn, device_manager.get_all_actuator_states())
 
     elif path == "/actuator" and method == "GET":
         name = query_params.get("name")
@@ -90,7 +149,10 @@ def handle_request(conn, path, method, query_params, body):
         send_response(conn, {"status": "OK"} if success else {"error": "Failed"}, 200 if success else 500)
 
     elif path == "/sensors" and method == "GET":
-        send_response(conn, device_manager.get_sensor_names())
+        send_cached(conn, request, "sensors")
+
+    elif path == "/sensors/all" and method == "GET":
+        send_response(conn, device_manager.get_all_sensor_readings())
 
     elif path == "/sensor" and method == "GET":
         name = query_params.get("name")
@@ -103,8 +165,49 @@ def handle_request(conn, path, method, query_params, body):
             return
         send_response(conn, result)
 
+    elif path == "/events" and method == "GET":
+        try:
+            interval = int(query_params.get("interval", config.SSE_DEFAULT_INTERVAL))
+        except ValueError:
+            send_response(conn, {"error": "Invalid interval"}, 400)
+            return
+        if len(event_hub.subscribers) >= config.SSE_MAX_SUBSCRIBERS:
+            send_response(conn, {"error": "Too many subscribers"}, 503)
+            return
+        send_all(conn, SSE_HEADERS)
+        event_hub.subscribe(conn, interval)
+        device_manager.publish_snapshot()
+        return True
+
+    elif path == "/sensor/history" and method == "GET":
+        name = query_params.get("name")
+        field = query_params.get("field")
+        resolution = query_params.get("res", "raw")
+        if not name or not field or resolution not in RESOLUTIONS:
+            send_response(conn, {"error": "Missing or invalid parameters"}, 400)
+            return
+        series = sensor_history.find(name, field)
+        if series is None:
+            send_response(conn, {"error": "History not found"}, 404)
+            return
+        response.reset()
+        sensor_history.write_json(response, name, series, resolution)
+        send_buffered(conn)
+
+    elif path == "/log/schema" and method == "GET":
+        send_response(conn, datalogger.schema())
+
+    elif path == "/log/export" and method == "GET":
+        export = datalogger.export()
+        try:
+            send_stream_headers(conn, export.length)
+        except Exception:
+            export.close()
+            raise
+        return export
+
     elif path == "/automations" and method == "GET":
-        send_response(conn, device_manager.get_automations_list())
+        send_cached(conn, request, "automations")
 
     elif path == "/automation/toggle" and method == "POST":
         name = query_params.get("name") or (body.get("name") if body else None)
@@ -123,65 +226,18 @@ def handle_request(conn, path, method, query_params, body):
         send_response(conn, {"status": "OK"})
 
     elif path == "/metadata" and method == "GET":
-        send_response(conn, device_manager.get_metadata())
+        send_cached(conn, request, "metadata")
 
     elif method == "OPTIONS":
         send_response(conn, "")
 
-def parse_request(request):
-    try:
-        lines = request.split("\r\n")
-        method, full_path, _ = lines[0].split()
-        if "?" in full_path:
-            path, query_string = full_path.split("?", 1)
-            query_params = dict(q.split("=") for q in query_string.split("&"))
-        else:
-            path = full_path
-            query_params = {}
-        body = None
-        if method in ["POST", "PUT"]:
-            body_data = lines[-1]
-            try:
-                body = json.loads(body_data)
-            except:
-                body = None
-        return method, path, query_params, body
-    except Exception as e:
-        return None, None, {}, None
-
-def start_server():
-    address = socket.getaddrinfo("0.0.0.0", 80)[0][-1]
-    server = socket.socket()
-    
-    server.bind(address)
-    server.listen(5)
-        
-    while True:
-        try:
-            conn, address = server.accept()
-            request = conn.recv(1024).decode()
-            method, path, query_params, body = parse_request(request)
-            if method:
-                handle_request(conn, path, method, query_params, body)
-            conn.close()
-        except Exception as e:
-            print("Request handling error:", e)
-        finally:
-            gc.collect()
-
-def start_dns_server(ap_ip='192.168.0.1'):
-    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server.bind(('0.0.0.0', 53))
-    
-    while True:
-        data, address = server.recvfrom(512)
-        response = data[:2] + b'\x81\x80' + data[4:6] + data[4:6] + b'\x00\x00\x00\x00' + data[12:]
-
-        response += b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04' + bytes(map(int, ap_ip.split('.')))
-        server.sendto(response, address)
+def dns_response(data, ip_bytes):
+    response = data[:2] + b'\x81\x80' + data[4:6] + data[4:6] + b'\x00\x00\x00\x00' + data[12:]
+    return response + b'\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04' + ip_bytes
 
 def main():
-    unit_manager.load_config()
+    with boot_report.phase("load_config"):
+        unit_manager.load_config()
 
     if config.DEBUG:
         unit = unit_manager.get_config()
@@ -192,37 +248,80 @@ def main():
         print(f"FW Version: {unit['fw_version']}")
         print(f"Name: {unit['name']}")
 
-    setup_wifi()
+    with boot_report.phase("setup_wifi"):
+        setup_wifi()
 
-    device_manager.load_devices()
-    device_manager.load_automations("/configs/automations.json")
+    with boot_report.phase("load_devices"):
+        device_manager.load_devices()
+    with boot_report.phase("load_automations"):
+        device_manager.load_automations(config.CONFIG_DIR + "/automations.json")
     
-    device_manager.init_devices()
-    device_manager.init_automations()
+    # Devices are initialized on first use, after boot; the report lists
+    # them as they come up
+    boot_report.devices = device_manager.init_timings
+    with boot_report.phase("init_automations"):
+        device_manager.init_automations()
+    with boot_report.phase("init_storage"):
+        sensor_history.build(device_manager)
+        datalogger.build(device_manager)
+
+    boot_report.finish()
+    gc_manager.setup()
+
+    if config.RUNTIME == "asyncio":
+        import async_runtime
+        async_runtime.run(device_manager, handle_request, dns_response)
+        return
 
+    # HTTP and DNS share one poll loop on a single thread
     import _thread
-    _thread.start_new_thread(start_server, ())
-    _thread.start_new_thread(start_dns_server, ())
+    import poll_server
+    _thread.start_new_thread(poll_server.serve, (handle_request, dns_response))
 
     last_actuator_update = 0
     last_automation_update = 0
+    last_history_update = 0
+    last_datalog_update = 0
+    last_gc_poll = 0
 
     while True:
         try:
+            started = time.ticks_us()
             now = time.ticks_ms()
 
             if time.ticks_diff(now, last_actuator_update) >= config.UPDATE_INTERVAL:
                 device_manager.update_actuators()
+                device_manager.update_sensors()
+                device_manager.sample_sensors()
+                if event_hub.subscribers:
+                    device_manager.publish_actuator_changes()
+                    event_hub.flush()
                 last_actuator_update = now
 
             if time.ticks_diff(now, last_automation_update) >= config.AUTOMATION_INTERVAL:
                 device_manager.update_automations()
                 last_automation_update = now
 
-            time.sleep_ms(10)
+            if time.ticks_diff(now, last_history_update) >= config.HISTORY_INTERVAL:
+                sensor_history.record()
+                last_history_update = now
+
+            if time.ticks_diff(now, last_datalog_update) >= config.DATALOG_INTERVAL:
+                datalogger.record()
+                last_datalog_update = now
 
-            if now % 10000 < 100:
-                gc.collect()
+            scheduler.run_pending()
+
+            elapsed_us = time.ticks_diff(time.ticks_us(), started)
+            metrics.loop_time.observe(elapsed_us)
+            if elapsed_us > config.UPDATE_INTERVAL * 1000:
+                metrics.loop_overruns.inc()
+
+            if time.ticks_diff(now, last_gc_poll) >= config.GC_POLL_INTERVAL:
+                gc_manager.poll()
+                last_gc_poll = now
+
+            time.sleep_ms(10)
 
         except KeyboardInterrupt:
             raise
@@ -0,0 +1,172 @@
+import gc
+import time
+from array import array
+
+# Bucket upper bounds in microseconds
+FAST_BUCKETS = (100, 500, 1000, 5000, 10000, 50000, 100000)
+GC_BUCKETS = (1000, 2000, 5000, 10000, 20000, 50000)
+# Coarse on purpose, there is one of these per route
+ROUTE_BUCKETS = (10000, 100000, 1000000)
+
+TEXT_HEADERS = (
+    b"Content-Type: text/plain; version=0.0.4\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n"
+)
+
+registry = []
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        registry.append(self)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, out):
+        out.write('%s%s %d\n' % (self.name, _labels(self.labels), self.value))
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, read, labels=''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.read = read
+        registry.append(self)
+
+    def render(self, out):
+        out.write('%s%s %s\n' % (self.name, _labels(self.labels), self.read()))
+
+class Histogram:
+    """Fixed-bucket histogram of microsecond durations"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.bounds = buckets
+        self.counts = array('L', (0 for _ in range(len(buckets) + 1)))
+        self.count = 0
+        # Sum split in two so it stays a small int on the hot path
+        self.sum_s = 0
+        self.sum_us = 0
+        registry.append(self)
+
+    def observe(self, value_us):
+        i = 0
+        for bound in self.bounds:
+            if value_us <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_us += value_us
+        if self.sum_us >= 1000000:
+            self.sum_s += self.sum_us // 1000000
+            self.sum_us %= 1000000
+
+    def render(self, out):
+        if not self.count and self.labels:
+            return  # Unused route or driver, nothing worth sending
+        prefix = self.labels + ',' if self.labels else ''
+        cumulative = 0
+        for i, bound in enumerate(self.bounds):
+            cumulative += self.counts[i]
+            out.write('%s_bucket{%sle="%s"} %d\n' % (self.name, prefix, _seconds(bound), cumulative))
+        out.write('%s_bucket{%sle="+Inf"} %d\n' % (self.name, prefix, self.count))
+        out.write('%s_sum%s %d.%06d\n' % (self.name, _labels(self.labels), self.sum_s, self.sum_us))
+        out.write('%s_count%s %d\n' % (self.name, _labels(self.labels), self.count))
+
+def label(name, value):
+    """One label pair with the value escaped for the text format"""
+    value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '%s="%s"' % (name, value)
+
+def _labels(labels):
+    return '{' + labels + '}' if labels else ''
+
+def _seconds(us):
+    return '%d.%06d' % (us // 1000000, us % 1000000)
+
+class _Lines:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        data = ''.join(self.parts).encode()
+        self.parts = []
+        return data
+
+def render():
+    """Yield every metric in Prometheus text format, one series at a time"""
+    names = []
+    for metric in registry:
+        if metric.name not in names:
+            names.append(metric.name)
+
+    out = _Lines()
+    for name in names:
+        family = [m for m in registry if m.name == name]
+        out.write('# HELP %s %s\n' % (name, family[0].help))
+        out.write('# TYPE %s %s\n' % (name, family[0].kind))
+        for metric in family:
+            metric.render(out)
+            if out.parts:
+                yield out.take()
+    if out.parts:
+        yield out.take()
+
+loop_time = Histogram('chlorofill_loop_seconds', 'Main loop iteration (or periodic task run) time', FAST_BUCKETS)
+loop_overruns = Counter('chlorofill_loop_overruns_total', 'Iterations that overran their interval')
+automation_evaluations = Counter('chlorofill_automation_evaluations_total', 'Automation condition evaluations')
+automation_triggers = Counter('chlorofill_automation_triggers_total', 'Automations triggered')
+gc_pause = Histogram('chlorofill_gc_pause_seconds', 'gc.collect() pause time', GC_BUCKETS)
+Gauge('chlorofill_heap_free_bytes', 'Free heap', gc.mem_free)
+Gauge('chlorofill_heap_alloc_bytes', 'Allocated heap', gc.mem_alloc)
+Gauge('chlorofill_uptime_seconds', 'Uptime', lambda: time.ticks_ms() // 1000)
+
+routes = {}
+
+def track_routes(paths):
+    """Create latency histograms for the routes handle_request serves"""
+    for path in paths + ('other',):
+        if path not in routes:
+            routes[path] = Histogram('chlorofill_request_seconds', 'HTTP request handling time',
+                                     ROUTE_BUCKETS, label('path', path))
+
+def request_latency(path):
+    """Latency histogram for a route, unknown paths share 'other'"""
+    histogram = routes.get(path)
+    if histogram is None:
+        histogram = routes['other']
+    return histogram
+
+track_routes(())
+
+drivers = {}
+
+def driver_timers(driver_name, driver):
+    """(read, update) histograms shared by every device of a driver"""
+    timers = drivers.get(driver_name)
+    if timers is None:
+        labels = label('driver', driver_name)
+        timers = (
+            Histogram('chlorofill_driver_read_seconds', 'Driver read() time', FAST_BUCKETS, labels)
+            if hasattr(driver, 'read') else None,
+            Histogram('chlorofill_driver_update_seconds', 'Driver update() time', FAST_BUCKETS, labels)
+            if hasattr(driver, 'update') else None
+        )
+        drivers[driver_name] = timers
+    return timers
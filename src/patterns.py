@@ -0,0 +1,118 @@
+import time
+import _thread
+from array import array
+from machine import Timer
+
+import config
+
+class Pattern:
+    """Steps of (value, duration_ms) played on an output"""
+    def __init__(self, output, steps, repeat=1, duration_ms=0, done=None):
+        self.output = output
+        self.values = array('I', steps[0::2])
+        self.durations = array('I', steps[1::2])
+        self.repeat = repeat  # 0 repeats until stopped or duration_ms runs out
+        self.duration_ms = duration_ms
+        self.done = done
+        self.key = None
+        self.index = 0
+        self.cycles = 0
+        self.started = 0
+        self.deadline = 0
+
+    def start(self, now):
+        self.index = 0
+        self.cycles = 0
+        self.started = now
+        self.deadline = time.ticks_add(now, self.durations[0])
+        self.output(self.values[0])
+
+    def advance(self, now):
+        """Move to the step due at now, returns False once finished"""
+        while time.ticks_diff(now, self.deadline) >= 0:
+            if self.duration_ms and time.ticks_diff(self.deadline, self.started) >= self.duration_ms:
+                return False
+            self.index += 1
+            if self.index == len(self.values):
+                self.index = 0
+                self.cycles += 1
+                if self.repeat and self.cycles >= self.repeat:
+                    return False
+            self.output(self.values[self.index])
+            # Deadlines advance from the previous one so late ticks do not drift
+            self.deadline = time.ticks_add(self.deadline, self.durations[self.index])
+        return True
+
+def parse_steps(text):
+    """Parse a 'value:ms,value:ms' sequence into a flat step list"""
+    steps = []
+    for step in text.split(','):
+        value, duration = step.split(':')
+        steps.append(int(value))
+        steps.append(int(duration))
+    return steps
+
+class PatternPlayer:
+    """Plays patterns from one periodic machine.Timer, independent of the main loop"""
+    def __init__(self):
+        self.playing = []
+        self.lock = _thread.allocate_lock()
+        self.timer = None
+        self._tick_cb = self._tick
+
+    def play(self, key, pattern):
+        """Start pattern, replacing whatever was playing under key"""
+        self.stop(key)
+        pattern.key = key
+        with self.lock:
+            pattern.start(time.ticks_ms())
+            self.playing.append(pattern)
+            if self.timer is None:
+                self.timer = Timer(config.PATTERN_TIMER_ID)
+                self.timer.init(period=config.PATTERN_TICK_MS, mode=Timer.PERIODIC,
+                                callback=self._tick_cb)
+
+    def stop(self, key):
+        """Stop the pattern playing under key without running its done callback"""
+        with self.lock:
+            for i, pattern in enumerate(self.playing):
+                if pattern.key == key:
+                    self.playing.pop(i)
+                    return True
+        return False
+
+    def is_playing(self, key):
+        for pattern in self.playing:
+            if pattern.key == key:
+                return True
+        return False
+
+    def _tick(self, timer):
+        # Runs as a scheduled callback, possibly while play() holds the lock
+        if not self.lock.acquire(False):
+            return
+        finished = None
+        try:
+            now = time.ticks_ms()
+            playing = self.playing
+            i = len(playing)
+            while i:
+                i -= 1
+                if not playing[i].advance(now):
+                    # Only allocated on the ticks where something ends
+                    if finished is None:
+                        finished = []
+                    finished.append(playing.pop(i))
+            if not playing and self.timer is not None:
+                self.timer.deinit()
+                self.timer = None
+        finally:
+            self.lock.release()
+
+        if finished is not None:
+            # Collected newest first, run the callbacks in start order
+            for pattern in reversed(finished):
+                if pattern.done:
+                    pattern.done()
+
+player = PatternPlayer()
@@ -0,0 +1,277 @@
+import time
+import errno
+import select
+import socket
+
+import config
+import metrics
+from events import event_hub
+from gc_manager import gc_manager
+from http_server import HTTPError, RequestReader, send_response
+
+# Connection states
+READING, WRITING, STREAMING = 0, 1, 2
+
+class PollConn:
+    """Non-blocking client connection, sends are copied into a queue the loop drains"""
+    def __init__(self, sock, reader):
+        self.sock = sock
+        self.reader = reader
+        self.state = READING
+        self.queue = []
+        self.offset = 0
+        self.stream = None
+        self.closing = False
+        self.deadline = time.ticks_add(time.ticks_ms(), config.HTTP_TIMEOUT)
+
+    def send(self, data):
+        # The caller reuses its buffer, so keep a copy
+        self.queue.append(bytes(data))
+        return len(data)
+
+    def backlog(self):
+        """Bytes queued but not yet accepted by the socket"""
+        return sum(len(chunk) for chunk in self.queue) - self.offset
+
+    def close(self):
+        # Closed by the loop, which may be polling the socket right now
+        self.closing = True
+
+    def touch(self):
+        self.deadline = time.ticks_add(time.ticks_ms(), config.HTTP_TIMEOUT)
+
+def _would_block(e):
+    return e.args and e.args[0] in (errno.EAGAIN, errno.ETIMEDOUT)
+
+class PollServer:
+    """HTTP and captive-portal DNS served from one select.poll loop"""
+    def __init__(self, handle_request, dns_response, ap_ip):
+        self.handle_request = handle_request
+        self.dns_response = dns_response
+        self.ip_bytes = bytes(map(int, ap_ip.split('.')))
+        self.poller = select.poll()
+        self.connections = {}
+        self.fds = {}
+        self.readers = [RequestReader() for _ in range(config.HTTP_MAX_CLIENTS)]
+        self.server = None
+        self.dns = None
+
+    def _register(self, sock, mask):
+        self.poller.register(sock, mask)
+        # CPython's poll reports file descriptors instead of sockets
+        if hasattr(sock, 'fileno'):
+            self.fds[sock.fileno()] = sock
+
+    def _unregister(self, sock):
+        try:
+            self.poller.unregister(sock)
+        except (OSError, KeyError):
+            pass
+        if hasattr(sock, 'fileno'):
+            self.fds.pop(sock.fileno(), None)
+
+    def start(self):
+        address = socket.getaddrinfo("0.0.0.0", config.HTTP_PORT)[0][-1]
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(5)
+        self.server.setblocking(False)
+        self._register(self.server, select.POLLIN)
+
+        self.dns = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.dns.bind(('0.0.0.0', config.DNS_PORT))
+        self.dns.setblocking(False)
+        self._register(self.dns, select.POLLIN)
+
+    def serve_forever(self):
+        self.start()
+        while True:
+            try:
+                self.poll_once(config.SERVER_POLL_INTERVAL)
+            except Exception as e:
+                print("Server loop error:", e)
+
+    def poll_once(self, timeout_ms):
+        # Responses being written and subscribers with queued events (fed
+        # from the main loop) need POLLOUT, the rest only wait for input
+        for conn in self.connections.values():
+            mask = select.POLLIN
+            if conn.state == WRITING or conn.queue:
+                mask |= select.POLLOUT
+            self.poller.modify(conn.sock, mask)
+
+        for entry in self.poller.poll(timeout_ms):
+            sock, event = entry[0], entry[1]
+            if isinstance(sock, int):
+                sock = self.fds.get(sock)
+            if sock is self.server:
+                self._accept(sock)
+            elif sock is self.dns:
+                self._answer_dns(sock)
+            else:
+                conn = self.connections.get(sock)
+                if conn is not None:
+                    self._service(conn, event)
+
+        self._expire()
+
+    def _accept(self, server):
+        try:
+            sock, address = server.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+
+        conn = PollConn(sock, self.readers.pop() if self.readers else None)
+        self.connections[sock] = conn
+        self._register(sock, select.POLLIN)
+
+        if conn.reader is None:
+            send_response(conn, {"error": "Too many connections"}, 503)
+            self._finish_request(conn)
+            return
+        conn.reader.reset()
+
+    def _answer_dns(self, dns):
+        try:
+            data, address = dns.recvfrom(512)
+            dns.sendto(self.dns_response(data, self.ip_bytes), address)
+        except OSError as e:
+            if not _would_block(e):
+                print("DNS error:", e)
+
+    def _service(self, conn, event):
+        if event & (select.POLLHUP | select.POLLERR):
+            self._close(conn)
+            return
+        if event & select.POLLIN:
+            self._read(conn)
+        if event & select.POLLOUT and conn.sock in self.connections:
+            self._write(conn)
+
+    def _read(self, conn):
+        if conn.state != READING:
+            # Nothing more is expected, only notice the client going away
+            try:
+                if not conn.sock.recv(64):
+                    self._close(conn)
+            except OSError as e:
+                if not _would_block(e):
+                    self._close(conn)
+            return
+
+        reader = conn.reader
+        readinto = getattr(conn.sock, 'readinto', None) or conn.sock.recv_into
+        try:
+            count = readinto(reader.free())
+            if count is None:
+                return
+            request = reader.feed(count)
+        except HTTPError as e:
+            send_response(conn, {"error": e.message}, e.status)
+            self._finish_request(conn)
+            return
+        except OSError as e:
+            if not _would_block(e):
+                self._close(conn)
+            return
+
+        conn.touch()
+        if request is not None:
+            self._dispatch(conn, request)
+
+    def _dispatch(self, conn, request):
+        result = None
+        start = time.ticks_us()
+        try:
+            result = self.handle_request(conn, request)
+        except HTTPError as e:
+            send_response(conn, {"error": e.message}, e.status)
+        except Exception as e:
+            print("Request handling error:", e)
+        metrics.request_latency(request.path).observe(time.ticks_diff(time.ticks_us(), start))
+
+        if result is True:
+            # Handed to the event hub, the queue is fed from the main loop
+            conn.state = STREAMING
+            self._release_reader(conn)
+            return
+        if result:
+            conn.stream = result
+        self._finish_request(conn)
+
+    def _finish_request(self, conn):
+        conn.state = WRITING
+        conn.touch()
+        self._release_reader(conn)
+        gc_manager.activity()
+
+    def _release_reader(self, conn):
+        if conn.reader is not None:
+            self.readers.append(conn.reader)
+            conn.reader = None
+
+    def _write(self, conn):
+        if not conn.queue and conn.stream is not None:
+            # Pull the next chunk of a streamed body only when there is room
+            try:
+                conn.send(next(conn.stream))
+            except StopIteration:
+                conn.stream = None
+            except Exception as e:
+                print("Stream error:", e)
+                self._close(conn)
+                return
+
+        while conn.queue:
+            chunk = conn.queue[0]
+            try:
+                sent = conn.sock.send(memoryview(chunk)[conn.offset:])
+            except OSError as e:
+                if not _would_block(e):
+                    self._close(conn)
+                return
+            if not sent:
+                return
+            conn.touch()
+            conn.offset += sent
+            if conn.offset < len(chunk):
+                return
+            conn.queue.pop(0)
+            conn.offset = 0
+
+        if conn.state == WRITING and conn.stream is None:
+            self._close(conn)
+
+    def _expire(self):
+        now = time.ticks_ms()
+        for conn in list(self.connections.values()):
+            if conn.closing:
+                self._close(conn)
+            elif conn.state == STREAMING and not conn.queue:
+                # Idle subscribers wait for events as long as they like
+                conn.touch()
+            elif time.ticks_diff(now, conn.deadline) >= 0:
+                self._close(conn)
+
+    def _close(self, conn):
+        sock = conn.sock
+        if self.connections.pop(sock, None) is None:
+            return
+        self._unregister(sock)
+        self._release_reader(conn)
+        if conn.state == STREAMING:
+            event_hub.disconnect(conn)
+        if conn.stream is not None:
+            # Client left mid-body, let the stream release what it holds
+            conn.stream.close()
+            conn.stream = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+def serve(handle_request, dns_response, ap_ip='192.168.0.1'):
+    """Run the HTTP server and DNS responder on the calling thread"""
+    PollServer(handle_request, dns_response, ap_ip).serve_forever()
@@ -0,0 +1,54 @@
+import time
+import heapq
+import _thread
+
+class Scheduler:
+    """Timer queue of deferred callbacks, run from the main loop"""
+    def __init__(self):
+        self.queue = []
+        self.lock = _thread.allocate_lock()
+        self.clock = 0
+        self.last_tick = time.ticks_ms()
+        self.sequence = 0
+
+    def _now(self):
+        # Monotonic milliseconds that survive ticks_ms() wrap-around
+        now = time.ticks_ms()
+        self.clock += time.ticks_diff(now, self.last_tick)
+        self.last_tick = now
+        return self.clock
+
+    def call_later(self, delay_ms, callback, arg=None):
+        """Run callback(arg) after delay_ms, returns a handle for cancel()"""
+        with self.lock:
+            entry = [self._now() + delay_ms, self.sequence, callback, arg]
+            self.sequence += 1
+            heapq.heappush(self.queue, entry)
+        return entry
+
+    def cancel(self, entry):
+        """Cancel a pending callback"""
+        if entry:
+            entry[2] = None
+
+    def pending(self):
+        return len(self.queue)
+
+    def run_pending(self):
+        """Run every callback whose deadline has passed"""
+        queue = self.queue
+        while True:
+            with self.lock:
+                if not queue or queue[0][0] > self._now():
+                    return
+                entry = heapq.heappop(queue)
+
+            callback = entry[2]
+            if callback is None:
+                continue
+            try:
+                callback(entry[3])
+            except Exception as e:
+                print(f'Scheduled callback error: {e}')
+
+scheduler = Scheduler()
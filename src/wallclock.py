@@ -0,0 +1,79 @@
+import time
+import _thread
+import machine
+
+# The RTC keeps local wall time; ports with a 2000 epoch are shifted to Unix
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+SECONDS_PER_DAY = 86400
+
+synced = False
+
+def now():
+    """Local wall time in seconds since the port's epoch"""
+    return int(time.time())
+
+def weekday(secs):
+    """Day of week for secs, Monday is 0"""
+    return time.gmtime(secs)[6]
+
+def set_time(timestamp, utc_offset=0):
+    """Set the RTC from a Unix timestamp and a UTC offset in minutes"""
+    global synced
+    t = time.gmtime(int(timestamp) + int(utc_offset) * 60 - EPOCH_OFFSET)
+    machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+    synced = True
+    wheel.rebuild()
+
+def to_dict():
+    t = time.gmtime(now())
+    return {
+        'time': '%04d-%02d-%02dT%02d:%02d:%02d' % t[:6],
+        'weekday': t[6],
+        'synced': synced
+    }
+
+class TimerWheel:
+    """Wall-clock deadlines kept sorted, so polling only looks at the head"""
+    def __init__(self):
+        self.entries = []
+        self.timers = []
+        self.lock = _thread.allocate_lock()
+
+    def add(self, timer):
+        """Track timer, an object with next_fire(now) and fire(at)"""
+        if timer not in self.timers:
+            self.timers.append(timer)
+        self._schedule(timer, now())
+
+    def _schedule(self, timer, current):
+        at = timer.next_fire(current)
+        if at is None:
+            return
+        with self.lock:
+            entries = self.entries
+            i = len(entries)
+            while i and entries[i - 1][0] > at:
+                i -= 1
+            entries.insert(i, (at, timer))
+
+    def rebuild(self):
+        """Recompute every deadline, e.g. after the clock was set"""
+        with self.lock:
+            self.entries = []
+        current = now()
+        for timer in self.timers:
+            self._schedule(timer, current)
+
+    def poll(self):
+        """Fire every timer whose deadline has passed"""
+        current = now()
+        while True:
+            with self.lock:
+                entries = self.entries
+                if not entries or entries[0][0] > current:
+                    return
+                at, timer = entries.pop(0)
+            timer.fire(at)
+            self._schedule(timer, current)
+
+wheel = TimerWheel()
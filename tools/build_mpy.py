@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Cross-compile the firmware modules to .mpy for faster boots.
+
+Usage: python tools/build_mpy.py [--march xtensawin] [--out build]
+
+Writes a device image to the output directory: compiled modules under
+mpy/ and mpy/drivers/, plus the source files that must stay editable
+(boot.py, main.py, config.py) and the JSON configs. Upload it with:
+
+    mpremote fs cp -r build/* :
+"""
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+# Kept as source: entry points and the user-editable config
+SOURCE_FILES = ('boot.py', 'main.py', 'config.py')
+
+def compile_module(mpy_cross, march, source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    subprocess.run([mpy_cross, '-march=' + march, '-o', target, source], check=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=(__doc__ or '').split('\n')[0])
+    parser.add_argument('--march', default='xtensawin', help='mpy-cross target architecture')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'build'), help='output directory')
+    parser.add_argument('--mpy-cross', default='mpy-cross', help='path to the mpy-cross binary')
+    args = parser.parse_args()
+
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit(f'{args.mpy_cross} not found, install it with: pip install mpy-cross')
+
+    shutil.rmtree(args.out, ignore_errors=True)
+    os.makedirs(args.out)
+
+    for source in sorted(glob.glob(os.path.join(SRC, '*.py'))):
+        name = os.path.basename(source)
+        if name in SOURCE_FILES:
+            shutil.copy(source, os.path.join(args.out, name))
+            continue
+        target = os.path.join(args.out, 'mpy', name[:-3] + '.mpy')
+        compile_module(args.mpy_cross, args.march, source, target)
+        print(f'Compiled {name}')
+
+    for source in sorted(glob.glob(os.path.join(SRC, 'drivers', '*.py'))):
+        name = os.path.basename(source)
+        target = os.path.join(args.out, 'mpy', 'drivers', name[:-3] + '.mpy')
+        compile_module(args.mpy_cross, args.march, source, target)
+        print(f'Compiled drivers/{name}')
+
+    shutil.copytree(os.path.join(SRC, 'configs'), os.path.join(args.out, 'configs'))
+    print(f'Image written to {args.out}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""Host stand-in for ds18x20, one probe that always reads 21.5 C"""
+
+class DS18X20:
+    def __init__(self, onewire):
+        self.onewire = onewire
+
+    def scan(self):
+        return [bytearray(8)]
+
+    def convert_temp(self):
+        pass
+
+    def read_temp(self, rom):
+        return 21.5
@@ -0,0 +1,120 @@
+"""Host stand-in for the parts of machine the firmware uses.
+
+Pins remember the last value written, ADCs read mid-scale and timers
+call back from a thread. Nothing here touches real hardware.
+"""
+import calendar
+import threading
+import time
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1):
+        self.id = id
+        self.level = 1 if pull == Pin.PULL_UP else 0
+        self.handler = None
+
+    def value(self, level=None):
+        if level is None:
+            return self.level
+        self.level = 1 if level else 0
+
+    __call__ = value
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.handler = handler
+
+class PWM:
+    def __init__(self, pin, freq=0, duty=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        pass
+
+class ADC:
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    def atten(self, attenuation):
+        pass
+
+    def width(self, bits):
+        pass
+
+    def read(self):
+        return 2048
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id):
+        self.id = id
+        self.stopped = None
+
+    def init(self, period=1000, mode=PERIODIC, callback=None):
+        self.deinit()
+        stopped = self.stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(period / 1000):
+                if callback is not None:
+                    callback(self)
+                if mode == Timer.ONE_SHOT:
+                    return
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def deinit(self):
+        if self.stopped is not None:
+            self.stopped.set()
+            self.stopped = None
+
+class RTC:
+    # Seconds the clock was moved by, added to time.time() by the host shim
+    offset = 0
+    memory_data = b''
+
+    def datetime(self, value=None):
+        if value is None:
+            t = time.gmtime(time.time())
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+        secs = calendar.timegm((value[0], value[1], value[2], value[4], value[5], value[6]))
+        RTC.offset += secs - int(time.time())
+
+    def memory(self, data=None):
+        if data is None:
+            return RTC.memory_data
+        RTC.memory_data = bytes(data)
+
+def reset_cause():
+    return SOFT_RESET
+
+def wake_reason():
+    return 0
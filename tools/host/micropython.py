@@ -0,0 +1,8 @@
+"""Host stand-in for micropython, only needed under CPython"""
+
+def const(value):
+    return value
+
+def schedule(func, arg):
+    # Nothing runs in a real interrupt here, so call it right away
+    func(arg)
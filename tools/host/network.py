@@ -0,0 +1,23 @@
+"""Host stand-in for network, the access point only records its settings"""
+STA_IF = 0
+AP_IF = 1
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.settings = {}
+        self.addresses = ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        self.enabled = False
+
+    def active(self, enabled=None):
+        if enabled is None:
+            return self.enabled
+        self.enabled = bool(enabled)
+
+    def config(self, **settings):
+        self.settings.update(settings)
+
+    def ifconfig(self, addresses=None):
+        if addresses is None:
+            return self.addresses
+        self.addresses = tuple(addresses)
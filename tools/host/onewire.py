@@ -0,0 +1,5 @@
+"""Host stand-in for onewire"""
+
+class OneWire:
+    def __init__(self, pin):
+        self.pin = pin
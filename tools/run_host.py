@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Run the firmware on a Linux host with the asyncio runtime.
+
+Usage: python tools/run_host.py [--port 8080] [--dns-port 5353] [--data DIR]
+
+Stand-ins for machine, network, onewire, ds18x20 and micropython come
+from tools/host/. The MicroPython-only parts of time, gc and sys are
+filled in here. Devices and automations are loaded from src/configs/;
+the unit config and the data log are written to the data directory.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS)
+SRC = os.path.join(ROOT, 'src')
+
+# Nominal ESP32 heap, only reported through /system/info and the metrics
+HOST_HEAP = 110000
+
+def install_shims():
+    """Put the stand-in modules and the firmware sources on sys.path"""
+    sys.path[:0] = [os.path.join(TOOLS, 'host'), SRC, os.path.join(SRC, 'drivers')]
+
+    import machine
+
+    started = time.monotonic()
+    real_time = time.time
+    time.time = lambda: real_time() + machine.RTC.offset
+    time.ticks_ms = lambda: int((time.monotonic() - started) * 1000)
+    time.ticks_us = lambda: int((time.monotonic() - started) * 1000000)
+    time.ticks_add = lambda ticks, delta: ticks + delta
+    time.ticks_diff = lambda new, old: new - old
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+    gc.mem_free = lambda: HOST_HEAP // 2
+    gc.mem_alloc = lambda: HOST_HEAP // 2
+    gc.threshold = lambda amount=None: -1
+    sys.print_exception = traceback.print_exception
+
+def main():
+    parser = argparse.ArgumentParser(description=(__doc__ or '').split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080, help='HTTP port')
+    parser.add_argument('--dns-port', type=int, default=5353, help='captive portal DNS port')
+    parser.add_argument('--data', help='directory for the unit config and data log (default: a temp dir)')
+    parser.add_argument('--debug', action='store_true', help='set config.DEBUG')
+    args = parser.parse_args()
+
+    install_shims()
+    data = args.data or tempfile.mkdtemp(prefix='chlorofill-')
+
+    import config
+    config.RUNTIME = 'asyncio'
+    config.DEBUG = args.debug
+    config.HTTP_PORT = args.port
+    config.DNS_PORT = args.dns_port
+    config.CONFIG_DIR = os.path.join(SRC, 'configs')
+    config.DATALOG_DIR = os.path.join(data, 'log')
+
+    import main as firmware
+    firmware.unit_manager.config_file = os.path.join(data, 'unit_config.json')
+
+    print(f'Serving on http://127.0.0.1:{args.port}, data in {data}')
+    firmware.main()
+
+if __name__ == '__main__':
+    main()
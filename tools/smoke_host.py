@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Smoke test: boot the firmware on the host and make one request.
+
+Usage: python tools/smoke_host.py [--timeout 15]
+
+Starts tools/run_host.py on free ports, waits for /system/info to answer
+with the unit's JSON and exits non-zero if it never does.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description=(__doc__ or '').split('\n')[0])
+    parser.add_argument('--timeout', type=float, default=15, help='seconds to wait for the unit')
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data:
+        unit = subprocess.Popen([sys.executable, os.path.join(TOOLS, 'run_host.py'),
+                                 '--port', str(port), '--dns-port', str(free_port(socket.SOCK_DGRAM)),
+                                 '--data', data])
+        try:
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline:
+                if unit.poll() is not None:
+                    sys.exit(f'Unit exited with {unit.returncode}')
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/system/info', timeout=2) as r:
+                        info = json.load(r)
+                except OSError:
+                    time.sleep(0.2)
+                    continue
+                if 'unit_id' not in info:
+                    sys.exit(f'Unexpected /system/info reply: {info}')
+                print(f"OK: {info['unit_id']} answered on port {port}")
+                return
+            sys.exit(f'No answer within {args.timeout}s')
+        finally:
+            unit.terminate()
+            unit.wait()
+
+if __name__ == '__main__':
+    main()